@@ -1,22 +1,46 @@
 from flask import render_template, request, current_app, jsonify
 from init import create_app
-from models import Player, League, Season, Division, Result, Ranking, \
-    get_last_result_before_date, get_season_by_raketo_name, get_common_divisions_in_season, \
-    get_lowest_division_in_season, parse_score, \
+from models import Player, League, Season, Division, Result, Ranking, RankingDelta, SeasonAlias, DataFingerprint, \
+    CONTENT_FINGERPRINT, set_fingerprint, \
+    load_season_aliases, invalidate_season_aliases, load_season_divisions, select_match_division, \
+    SCORE_COLUMNS, ScoreParseError, parse_score_columns, match_content_hash, \
     Match, get_player_match_history, get_player_opponents, \
     get_player_seasons, calculate_h2h_stats
+from data import seasons_data
 from data.seasons_data import init_seasons_data
-from sqlalchemy import or_
+from ranking import load_result_rows, get_ranking_rules, get_ranking_dates, get_earliest_affected_date, \
+    compute_partitioned_snapshots, snapshot_mappings, encode_ranking_deltas, load_ranking_state, get_rankings_data, \
+    get_ranking_index, invalidate_ranking_index, get_rankings_at, load_career_highs, load_last_rankings, \
+    ALL_PARTITION, get_ranking_partitions, partition_rows, get_stored_partitions, season_checksums, \
+    SEASON_FINGERPRINT_PREFIX
+from sqlalchemy import insert, update, func, inspect, text
 from extensions import db
+from jobs import job_runner
+from ratelimit import TokenBucketLimiter
+from build import BuildNode, table_fingerprint, file_fingerprint
+from cache import cached_page, bump_data_version
+from ranking_snapshot import publish_ranking_snapshot, get_ranking_snapshot, get_current_rankings
+from names import PlayerNameIndex, get_player_name_index, invalidate_player_name_index, get_player_search_index
 import json
+import math
 from datetime import datetime
+from functools import wraps
+from itertools import count
+from types import SimpleNamespace
 import os
+import io
 import csv
+import hashlib
+import hmac
+import sqlite3
 
 app = create_app()
 
+search_limiter = TokenBucketLimiter(app.config.get('SEARCH_RATE_LIMIT', 5), app.config.get('SEARCH_RATE_BURST', 20))
+
 
 def delete_all():
+    RankingDelta.query.delete()
     Ranking.query.delete()
     Result.query.delete()
     Player.query.delete()
@@ -26,306 +50,912 @@ def delete_all():
     Match.query.delete()
 
     db.session.commit()
+    invalidate_ranking_index()
+    invalidate_player_name_index()
+    bump_data_version()
+    publish_ranking_snapshot()
     return
 
 
-def input_data_from_json(file):
+def iter_json_leagues(file, chunk_size=65536):
+    """
+    Walk {league_name: [season, ...]} JSON from file without loading it whole.
+    Only one season object is decoded and held in memory at a time.
+    Seasons of a league must be consumed before moving on to the next league.
+    :param file: text file object
+    :param chunk_size: number of characters read at a time
+    :return: generator of (league_name, generator of season dicts)
+    """
+    decoder = json.JSONDecoder()
+    state = {'buf': '', 'pos': 0, 'eof': False}
+
+    def fill():
+        chunk = file.read(chunk_size)
+        if not chunk:
+            state['eof'] = True
+        state['buf'] = state['buf'][state['pos']:] + chunk
+        state['pos'] = 0
+
+    def next_char():
+        while True:
+            buf, pos = state['buf'], state['pos']
+            while pos < len(buf) and buf[pos] in ' \t\n\r':
+                pos += 1
+            state['pos'] = pos
+            if pos < len(buf):
+                return buf[pos]
+            if state['eof']:
+                raise ValueError('Unexpected end of JSON data')
+            fill()
+
+    def expect(chars):
+        c = next_char()
+        if c not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON data, got {c!r}")
+        state['pos'] += 1
+        return c
+
+    def decode():
+        next_char()
+        while True:
+            try:
+                value, state['pos'] = decoder.raw_decode(state['buf'], state['pos'])
+                return value
+            except json.JSONDecodeError:
+                # value is split across chunks
+                if state['eof']:
+                    raise
+                fill()
+
+    def seasons():
+        expect('[')
+        if next_char() == ']':
+            state['pos'] += 1
+            return
+        while True:
+            yield decode()
+            if expect(',]') == ']':
+                return
+
+    expect('{')
+    if next_char() == '}':
+        return
+    while True:
+        league_name = decode()
+        expect(':')
+        league_seasons = seasons()
+        yield league_name, league_seasons
+        for _ in league_seasons:  # skip seasons the caller did not consume
+            pass
+        if expect(',}') == '}':
+            return
+
+
+def input_data_from_json(file, batch_size=1000):
     """Add all leagues, seasons, divisions, players, results from file.
 
     Must be invoked within app_context.
-    This function now performs the import within a single transaction to avoid
-    per-object commits and to ensure atomicity.
+    The file is read season by season, ids are assigned client-side and rows are
+    written with executemany batches within a single transaction.
+    :param file: JSON file object {league_name: [season, ...]}
+    :param batch_size: number of results collected before pending rows are written
     """
-    d = json.load(file)
+    # parents first, so every batch references already inserted rows
+    pending = {League: [], Season: [], Division: [], Player: [], Result: []}
+
+    def write_pending():
+        for model, rows in pending.items():
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+                rows.clear()
 
     # Use a transaction: either everything is committed, or rolled back on error
     with db.session.begin():
+        next_ids = {model: count((db.session.query(func.max(model.id)).scalar() or 0) + 1)
+                    for model in (League, Season, Division, Player)}
+
         # Cache existing players to reduce queries for repeated names
         existing_players = {}
         for p in Player.query.all():
             key = (p.first_name.strip(), p.last_name.strip())
-            existing_players[key] = p
+            existing_players[key] = p.id
 
-        for league_name, seasons_list in d.items():
-            league = League(name=league_name)
-            db.session.add(league)
-            db.session.flush()
+        for league_name, seasons_list in iter_json_leagues(file):
+            league_id = next(next_ids[League])
+            pending[League].append({'id': league_id, 'name': league_name})
 
             for s in seasons_list:
-                season = Season(
-                    name=s.get('name'),
-                    year=s.get('year'),
-                    league_id=league.id,
-                    date_start=datetime.strptime(s['date_start'], "%Y-%m-%d") if s.get('date_start') else None,
-                    date_end=datetime.strptime(s['date_end'], "%Y-%m-%d") if s.get('date_end') else None,
-                    is_ranked=True
-                )
-
-                if 'is_ranked' in s and s['is_ranked'] in (0, "0", False, "false", "False"):
-                    season.is_ranked = False
-
-                db.session.add(season)
-                db.session.flush()
+                season_id = next(next_ids[Season])
+                pending[Season].append({
+                    'id': season_id,
+                    'name': s.get('name'),
+                    'year': s.get('year'),
+                    'league_id': league_id,
+                    'date_start': datetime.strptime(s['date_start'], "%Y-%m-%d").date() if s.get('date_start') else None,
+                    'date_end': datetime.strptime(s['date_end'], "%Y-%m-%d").date() if s.get('date_end') else None,
+                    'is_ranked': not ('is_ranked' in s and s['is_ranked'] in (0, "0", False, "false", "False")),
+                })
 
                 for div in s.get('divisions', []):
-                    division = Division(
-                        name=div.get('name'),
-                        priority=div.get('priority'),
-                        season_id=season.id
-                    )
-                    db.session.add(division)
-                    db.session.flush()
+                    division_id = next(next_ids[Division])
+                    pending[Division].append({
+                        'id': division_id,
+                        'name': div.get('name'),
+                        'priority': div.get('priority'),
+                        'season_id': season_id,
+                    })
 
                     for r in div.get('results', []):
                         first = r.get('first_name', '').strip()
                         last = r.get('last_name', '').strip()
                         player_key = (first, last)
 
-                        player = existing_players.get(player_key)
-                        if player is None:
-                            player = Player(first_name=first, last_name=last, gender=r.get('gender'))
-                            db.session.add(player)
-                            # flush to get player.id for dependent objects
-                            db.session.flush()
-                            existing_players[player_key] = player
-
-                        result = Result(
-                            player_id=player.id,
-                            position=r.get('position'),
-                            match_count=r.get('match_count'),
-                            win_count=r.get('win_count'),
-                            tie_win_count=r.get('tie_win_count'),
-                            set_diff=r.get('set_diff'),
-                            game_diff=r.get('game_diff'),
-                            division_id=division.id,
-                            relegation=r.get('relegation')
-                        )
-                        db.session.add(result)
-
+                        player_id = existing_players.get(player_key)
+                        if player_id is None:
+                            player_id = next(next_ids[Player])
+                            pending[Player].append({
+                                'id': player_id,
+                                'first_name': first,
+                                'last_name': last,
+                                'gender': r.get('gender'),
+                            })
+                            existing_players[player_key] = player_id
+
+                        pending[Result].append({
+                            'player_id': player_id,
+                            'position': r.get('position'),
+                            'match_count': r.get('match_count'),
+                            'win_count': r.get('win_count'),
+                            'tie_win_count': r.get('tie_win_count'),
+                            'set_diff': r.get('set_diff'),
+                            'game_diff': r.get('game_diff'),
+                            'division_id': division_id,
+                            'relegation': r.get('relegation'),
+                        })
+
+                    if len(pending[Result]) >= batch_size:
+                        write_pending()
+
+        write_pending()
+
+    invalidate_player_name_index()
+    bump_data_version()
+    publish_ranking_snapshot()
     # end of transaction block will commit if no exception occurred
     return
 
 
-def calculate_rankings(date):
+def calculate_rankings(date, rows=None, commit=True, partition=ALL_PARTITION):
     """
     Calculate rankings for given date
+
+    :param rows: result rows preloaded with ranking.load_result_rows(), pass them
+        when calculating several dates to fetch results only once
+    :param commit: set to False to calculate several dates in one transaction
+    :param partition: ranking partition, see ranking.get_ranking_partitions
     """
-    results = []
+    rules = get_ranking_rules()
+    if rows is None:
+        rows = load_result_rows(filter_seasons=rules.filter_seasons)
 
-    for player in Player.query.all():
-        last_result = get_last_result_before_date(player.id, date, filter_seasons='ranked', expire_days=365)
+    career_highs = load_career_highs(before=date, partition=partition)
+    ranked = rules.rank(partition_rows(rows, partition), date)
+    rankings = [Ranking(**mapping) for mapping in snapshot_mappings(date, ranked, career_highs, partition)]
 
-        if not last_result:
-            continue
+    db.session.add_all(rankings)
+    if commit:
+        db.session.commit()
+        publish_ranking_snapshot()
+    invalidate_ranking_index()
+    bump_data_version()
 
-        prev_priority = last_result.division_ref.priority
-        position = last_result.position
-        result_date = last_result.division_ref.season_ref.date_end
-
-        new_priority = last_result.calc_new_priority()
-
-        results.append({'last_result': last_result,
-                        'new_priority': new_priority,
-                        'prev_priority': prev_priority,
-                        'position': position,
-                        'result_date': result_date,
-                        'player': player})
-
-    sorted_items = sorted(
-        results,
-        key=lambda x: (
-            x['new_priority'],  # (ascending)
-            x['prev_priority'],  # (ascending)
-            x['position'],  # (ascending)
-            -(x['result_date'].toordinal())  # (descending)
-        )
-    )
+    return rankings
 
-    rankings = []
-    for i, value in enumerate(sorted_items):
-        ranking = Ranking(player_id=value['player'].id,
-                          position=i + 1,
-                          actual_date=date,
-                          actual_season_id=value['last_result'].division_ref.season_id,
-                          last_result_id=value['last_result'].id)
 
-        rankings.append(ranking)
+def store_rankings(snapshots, since=None, checksums=None):
+    """
+    Replace ranking snapshots dated since (all if None) with snapshots, in one transaction.
+
+    With RANKING_STORAGE = 'delta' the history is written as RankingDelta rows and only
+    the latest snapshot of every partition is kept in Ranking.
+    :param snapshots: dict partition -> dict date -> list of ResultRow ordered by position
+    :param checksums: ranking.season_checksums of the rows the snapshots were computed from, stored
+        in the same transaction so update_rankings can detect later changes
+    :return: number of rows written
+    """
+    delta_storage = current_app.config.get('RANKING_STORAGE') == 'delta'
+
+    if not since:
+        RankingDelta.query.delete()
+        Ranking.query.delete()
+
+    written = 0
+    mappings = []
+    for partition, partition_snapshots in snapshots.items():
+        dates = sorted(partition_snapshots)
+
+        # running best positions, snapshots must be processed in date order
+        career_highs = load_career_highs(before=since, partition=partition) if since else {}
+        for date in dates:
+            snapshot = snapshot_mappings(date, partition_snapshots[date], career_highs, partition)
+            if not delta_storage or date == dates[-1]:
+                mappings.extend(snapshot)
+                if not delta_storage:
+                    written += len(snapshot)
+
+        if since and delta_storage:
+            RankingDelta.query.filter(RankingDelta.partition == partition, RankingDelta.actual_date >= since) \
+                .delete()
+            if dates:
+                Ranking.query.filter(Ranking.partition == partition).delete()
+        elif since:
+            Ranking.query.filter(Ranking.partition == partition, Ranking.actual_date >= since).delete()
+
+        if delta_storage:
+            base = load_ranking_state(since, before=True, partition=partition)[1] if since else {}
+            deltas = encode_ranking_deltas(partition_snapshots, base, partition)
+            if deltas:
+                db.session.execute(insert(RankingDelta), deltas)
+            written += len(deltas)
+
+    if mappings:
+        db.session.execute(insert(Ranking), mappings)
+    if checksums is not None:
+        DataFingerprint.query.filter(DataFingerprint.name.startswith(SEASON_FINGERPRINT_PREFIX)) \
+            .delete(synchronize_session=False)
+        db.session.add_all(DataFingerprint(name=f'{SEASON_FINGERPRINT_PREFIX}{season_id}', checksum=checksum)
+                           for season_id, checksum in checksums.items())
+    db.session.commit()
+    invalidate_ranking_index()
+    bump_data_version()
+    publish_ranking_snapshot()
 
-        db.session.add(ranking)
+    return written
 
-    db.session.commit()
 
-    return rankings
+def update_rankings(season_ids=None, jobs=1):
+    """
+    Recalculate only ranking snapshots that can be affected by changes.
+
+    Snapshots dated before the earliest affected date (see ranking.get_earliest_affected_date)
+    are kept as is; later ones are replaced in all partitions in a single transaction.
+    :param season_ids: ids of seasons whose results changed, seasons with changed results are
+        detected from the checksums stored with the snapshots in any case
+    :return: list of recalculated dates
+    """
+    rules = get_ranking_rules()
+    rows = load_result_rows(filter_seasons=rules.filter_seasons)
+    since = get_earliest_affected_date(season_ids, rows=rows)
+    if since is None:
+        return []
+
+    dates = get_ranking_dates(since)
+    snapshots = compute_partitioned_snapshots(rows, dates, get_ranking_partitions(rows), jobs=jobs, rules=rules)
+    store_rankings(snapshots, since=since, checksums=season_checksums(rows))
+
+    return dates
+
+
+def rebuild_rankings(jobs=1):
+    """
+    Recalculate all ranking snapshots.
+
+    Snapshots of every partition are computed from one extract of ranked results (in jobs
+    worker processes if jobs > 1) and all rows are then written in a single bulk insert.
+    :return: number of ranking rows written
+    """
+    rules = get_ranking_rules()
+    rows = load_result_rows(filter_seasons=rules.filter_seasons)
+    snapshots = compute_partitioned_snapshots(rows, get_ranking_dates(), get_ranking_partitions(rows), jobs=jobs,
+                                              rules=rules)
+
+    return store_rankings(snapshots, checksums=season_checksums(rows))
 
 
-def import_matches_from_csv(file_path, batch_size=50):
+def import_matches_from_csv(file_path, batch_size=1000, upsert=False, progress=None, dry_run=False, fuzzy=False):
     """
-    Import matches from CSV file to database
+    Import matches from CSV file to database.
+    :param file_path: CSV with winner, loser, score, season, date columns
+    :param batch_size: number of matches per insert statement
+    :param upsert: skip rows imported before instead of inserting them again
+    :param progress: callable receiving progress event dicts, see import_match_rows
+    :param dry_run: only resolve and count the rows, see import_match_rows
+    :param fuzzy: accept misspelled player names, see import_match_rows
+    :return: dict with imported, skipped, existing and errors counts
     """
+    with open(file_path, 'r', encoding='utf-8') as csvfile:
+        return import_match_rows(enumerate(csv.DictReader(csvfile)), batch_size=batch_size, upsert=upsert,
+                                 progress=progress, dry_run=dry_run, fuzzy=fuzzy)
+
+
+def import_match_rows(rows, batch_size=1000, upsert=False, progress=None, occurrences=None, dry_run=False,
+                      fuzzy=False):
+    """
+    Import parsed match CSV rows to database.
+    Players, seasons and divisions are resolved in memory from indexes loaded once,
+    matches are inserted in executemany batches, each committed on its own.
+    Every match stores a content hash of its row. In upsert mode rows whose hash is
+    already stored are skipped, so the same file can be imported again after new rows were added.
+    :param rows: iterable of (row number, row dict)
+    :param batch_size: number of matches per insert statement
+    :param upsert: skip rows imported before instead of inserting them again
+    :param progress: callable receiving progress event dicts ('event' is one of skipped, row_error,
+        batch, batch_error, completed), print_import_progress by default
+    :param occurrences: dict content hash of the first occurrence of a row -> number of identical rows
+        seen so far, updated in place; pass the counts of the earlier rows when importing a file in parts
+    :param dry_run: resolve rows and report progress without writing matches, imported counts the rows
+        that would be inserted
+    :param fuzzy: resolve names that differ from a player's name by a few letters to the closest player
+        (a 'resolved' event is reported); by default such rows are skipped with the closest players as
+        'suggestions', names are only matched regardless of alphabet, case, accents and word order
+    :return: dict with imported, skipped, existing and errors counts
+    :raise DatabaseReplacedError: if rebuild_database_file replaced the database file during the import,
+        ids resolved from the previous file must not be written to the new one
+    """
+    progress = progress or print_import_progress
+    database_file_id = get_database_file_id()
     imported_count = 0
+    rows_read = 0
     skipped_count = 0
+    existing_count = 0
     error_count = 0
 
     existing_players = {}
-    for p in Player.query.all():
+    players = Player.query.all()
+    for p in players:
         key = p.last_name.strip() + ' ' + p.first_name.strip()
-        existing_players[key] = p
+        existing_players[key] = p.id
+    name_index = None
+    season_ids = {s_id for s_id, in db.session.query(Season.id)}
+    # read per import: long-running importers must see aliases added by other processes
+    season_aliases = load_season_aliases()
+    season_divisions = load_season_divisions()
+    if occurrences is None:
+        occurrences = {}
+
+    def insert_batch(batch):
+        if get_database_file_id() != database_file_id:
+            raise DatabaseReplacedError(f"Database file was replaced, {imported_count} matches were imported "
+                                        f"into the previous one")
+        existing = 0
+        if upsert:
+            hashes = [m['content_hash'] for m in batch]
+            stored = {h for h, in db.session.query(Match.content_hash).filter(Match.content_hash.in_(hashes))}
+            new_batch = [m for m in batch if m['content_hash'] not in stored]
+            existing = len(batch) - len(new_batch)
+            batch = new_batch
+            if not batch:
+                return 0, 0, existing
+        if dry_run:
+            return len(batch), 0, existing
+        try:
+            db.session.execute(Match.__table__.insert(), batch)
+            db.session.commit()
+            bump_data_version()
+            progress({'event': 'batch', 'imported': imported_count + len(batch), 'skipped': skipped_count,
+                      'existing': existing_count + existing, 'errors': error_count, 'rows': rows_read})
+            return len(batch), 0, existing
+        except Exception as e:
+            db.session.rollback()
+            progress({'event': 'batch_error', 'size': len(batch), 'error': str(e)})
+            return 0, len(batch), existing
 
-    with open(file_path, 'r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
+    batch = []
+    for i, row in rows:
+        rows_read += 1
+        try:
+            # Parse data from row
+            winner_name = row.get('winner', '').strip()
+            loser_name = row.get('loser', '').strip()
+            score = ' '.join(row.get('score', '').split())
+            season_name = row.get('season', '').strip()
+            date_str = row.get('date', '').strip()
+
+            # Skip rows with missing essential data
+            if not all([winner_name, loser_name, score, season_name, date_str]):
+                progress({'event': 'skipped', 'row': i, 'reason': "Missing essential data"})
+                skipped_count += 1
+                continue
 
-        for i, row in enumerate(reader):
+            # Parse date
             try:
-                # Parse data from row
-                winner_name = row.get('winner', '').strip()
-                loser_name = row.get('loser', '').strip()
-                score = row.get('score', '').strip()
-                season_name = row.get('season', '').strip()
-                date_str = row.get('date', '').strip()
-
-                # Skip rows with missing essential data
-                if not all([winner_name, loser_name, score, season_name, date_str]):
-                    print(f"Skipping row {i}: Missing essential data")
-                    skipped_count += 1
-                    continue
-
-                # Parse date
-                try:
-                    match_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    print(f"Skipping row {i}: Invalid date format: {date_str}")
-                    skipped_count += 1
-                    continue
-
-                if winner_name not in existing_players or loser_name not in existing_players:
-                    print(f"Skipping row {i}: Unknown player: {winner_name} vs {loser_name}")
-                    skipped_count += 1
-                    continue
-
-                # Get or create players
-                winner = existing_players[winner_name]
-                loser = existing_players[loser_name]
-
-                # Get season
-                season = get_season_by_raketo_name(season_name)
-                if not season:
-                    print(f"Skipping row {i}: Unknown season: {season_name}")
-                    skipped_count += 1
-                    continue
-
-                # Get division
-                divisions = get_common_divisions_in_season(winner.id, loser.id, season.id)
-                if len(divisions) == 0:
-                    divisions = [get_lowest_division_in_season(winner.id, loser.id, season.id)]
-                if len(divisions) == 0:
-                    print(f"Skipping row {i}: No common divisions in {season_name} for {winner_name} vs {loser_name}")
-                    skipped_count += 1
-                    continue
-
-                division = divisions[0]
-                for d in divisions:
-                    if division.priority < d.priority:
-                        division = d  # select max priority division if there were several common ones
-
-                # Parse score
-                parsed_score = parse_score(score)
-                if not parsed_score:
-                    print(f"Skipping row {i}: Could not parse score: {score}")
-                    skipped_count += 1
-                    continue
-
-                # Create match record
-                match = Match(
-                    date_played=match_date,
-                    season_id=season.id,
-                    division_id=division.id,
-                    player1_id=winner.id,  # Winner is player1
-                    player2_id=loser.id,  # Loser is player2
-                    winner_id=winner.id,
-                )
-
-                # Set score based on parsed structure
-                sets = parsed_score['sets']
-                # Game in sets
-
-                # Set 1
-                if len(sets) > 0:
-                    match.set1_player1 = sets[0]['player1']  # Winner's games
-                    match.set1_player2 = sets[0]['player2']  # Loser's games
-                    if sets[0]['tiebreak']:
-                        match.tb1_player1 = sets[0]['tiebreak_score']['player1']
-                        match.tb1_player2 = sets[0]['tiebreak_score']['player2']
-
-                # Set 2
-                if len(sets) > 1:
-                    match.set2_player1 = sets[1]['player1']
-                    match.set2_player2 = sets[1]['player2']
-                    if sets[1]['tiebreak']:
-                        match.tb2_player1 = sets[1]['tiebreak_score']['player1']
-                        match.tb2_player2 = sets[1]['tiebreak_score']['player2']
-
-                # Set 3 (if exists and not royal tiebreak)
-                if len(sets) > 2 and not parsed_score['royal_tiebreak']:
-                    match.set3_player1 = sets[2]['player1']
-                    match.set3_player2 = sets[2]['player2']
-                    if sets[2]['tiebreak']:
-                        match.tb3_player1 = sets[2]['tiebreak_score']['player1']
-                        match.tb3_player2 = sets[2]['tiebreak_score']['player2']
-
-                # Royal tiebreak
-                if parsed_score['royal_tiebreak'] and parsed_score['royal_tiebreak_score']:
-                    match.royal_tiebreak_player1 = parsed_score['royal_tiebreak_score'][0]  # Winner's points
-                    match.royal_tiebreak_player2 = parsed_score['royal_tiebreak_score'][1]  # Loser's points
-
-                db.session.add(match)
-                imported_count += 1
-
-                # Commit in batches for performance
-                if imported_count % batch_size == 0:
-                    db.session.commit()
-                    print(f"Imported {imported_count} matches...")
-
-            except Exception as e:
-                error_count += 1
-                print(f"Error importing row {i}: {str(e)}")
-                print(f"Row data: {row}")
-                db.session.rollback()
+                match_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            except ValueError:
+                progress({'event': 'skipped', 'row': i, 'reason': f"Invalid date format: {date_str}"})
+                skipped_count += 1
                 continue
 
-        # Final commit
-        try:
-            db.session.commit()
-            print(f"\nImport completed!")
-            print(f"Successfully imported: {imported_count}")
-            print(f"Skipped: {skipped_count}")
-            print(f"Errors: {error_count}")
+            player_ids = []
+            suggestions = {}
+            for name in (winner_name, loser_name):
+                player_id = existing_players.get(name)
+                if player_id is None:
+                    # transliteration, case or word order differences
+                    if name_index is None:
+                        name_index = PlayerNameIndex((p.id, p.first_name, p.last_name) for p in players)
+                    player_id = name_index.resolve(name, max_distance=0)
+                    if player_id is None:
+                        # spelling differences: a guess, only written to matches when asked for
+                        guess = name_index.resolve(name)
+                        if fuzzy:
+                            player_id = guess
+                        elif guess is not None:
+                            suggestions[name] = guess
+                    if player_id is not None:
+                        existing_players[name] = player_id
+                        progress({'event': 'resolved', 'row': i, 'name': name, 'player_id': player_id})
+                player_ids.append(player_id)
+            winner_id, loser_id = player_ids
+
+            if winner_id is None or loser_id is None:
+                reason = f"Unknown player: {winner_name} vs {loser_name}"
+                if suggestions:
+                    names = {p.id: f"{p.last_name} {p.first_name}" for p in players}
+                    reason += " (closest: " + ", ".join(f"{name} -> {names[player_id]}"
+                                                        for name, player_id in suggestions.items()) + ")"
+                progress({'event': 'skipped', 'row': i, 'reason': reason, 'suggestions': suggestions})
+                skipped_count += 1
+                continue
+
+            # Get season
+            season_id = season_aliases.get(season_name)
+            if season_id not in season_ids:
+                progress({'event': 'skipped', 'row': i, 'reason': f"Unknown season: {season_name}"})
+                skipped_count += 1
+                continue
+
+            # Get division
+            division_id = select_match_division(season_divisions, winner_id, loser_id, season_id)
+            if division_id is None:
+                progress({'event': 'skipped', 'row': i, 'season_id': season_id, 'player_ids': [winner_id, loser_id],
+                          'reason': f"No common divisions in {season_name} for {winner_name} vs {loser_name}"})
+                skipped_count += 1
+                continue
+
+            # Parse score
+            try:
+                score_columns = parse_score_columns(score, row=i)
+            except ScoreParseError:
+                progress({'event': 'skipped', 'row': i, 'reason': f"Could not parse score: {score}"})
+                skipped_count += 1
+                continue
+
+            row_key = (winner_name, loser_name, season_name, date_str, score)
+            content_hash = match_content_hash(*row_key)
+            occurrence = occurrences.get(content_hash, 0)
+            occurrences[content_hash] = occurrence + 1
+            if occurrence:
+                content_hash = match_content_hash(*row_key, occurrence=occurrence)
+
+            match = dict(
+                content_hash=content_hash,
+                date_played=match_date,
+                season_id=season_id,
+                division_id=division_id,
+                player1_id=winner_id,  # Winner is player1
+                player2_id=loser_id,  # Loser is player2
+                winner_id=winner_id,
+            )
+            match.update(zip(SCORE_COLUMNS, score_columns))
+            batch.append(match)
+
         except Exception as e:
-            db.session.rollback()
-            print(f"Final commit failed: {str(e)}")
+            error_count += 1
+            progress({'event': 'row_error', 'row': i, 'error': str(e), 'data': row})
+            continue
+
+        if len(batch) >= batch_size:
+            inserted, failed, existing = insert_batch(batch)
+            imported_count += inserted
+            error_count += failed
+            existing_count += existing
+            batch = []
+
+    if batch:
+        inserted, failed, existing = insert_batch(batch)
+        imported_count += inserted
+        error_count += failed
+        existing_count += existing
 
-    return {
+    counts = {
         'imported': imported_count,
         'skipped': skipped_count,
+        'existing': existing_count,
         'errors': error_count
     }
+    progress(dict(counts, event='completed', rows=rows_read, upsert=upsert, fuzzy=fuzzy))
+    return counts
+
+
+def print_import_progress(event):
+    """Default progress handler of import_match_rows: print events as text"""
+    kind = event['event']
+    if kind == 'skipped':
+        print(f"Skipping row {event['row']}: {event['reason']}")
+    elif kind == 'resolved':
+        print(f"Row {event['row']}: {event['name']} resolved to player {event['player_id']}")
+    elif kind == 'row_error':
+        print(f"Error importing row {event['row']}: {event['error']}")
+        print(f"Row data: {event['data']}")
+    elif kind == 'batch':
+        print(f"Imported {event['imported']} matches...")
+    elif kind == 'batch_error':
+        print(f"Error importing batch of {event['size']} matches: {event['error']}")
+    elif kind == 'completed':
+        print(f"\nImport completed!")
+        print(f"Successfully imported: {event['imported']}")
+        if event['upsert']:
+            print(f"Already imported: {event['existing']}")
+        print(f"Skipped: {event['skipped']}")
+        print(f"Errors: {event['errors']}")
+
+
+def read_appended_csv_rows(file_path, offset=0, fieldnames=None, row_number=0):
+    """
+    Read complete CSV lines appended to file after the given byte offset.
+    A trailing line without newline is left for the next read.
+    :param offset: byte offset where the previous read stopped, 0 to read the header too
+    :param fieldnames: header read before, required if offset is not 0
+    :param row_number: number of rows read before
+    :return: (list of (row number, row dict), new offset, fieldnames)
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    data = data[:data.rfind(b'\n') + 1]
+    if not data:
+        return [], offset, fieldnames
+
+    text = data.decode('utf-8-sig' if offset == 0 else 'utf-8')
+    reader = csv.DictReader(io.StringIO(text, newline=''), fieldnames=None if offset == 0 else fieldnames)
+    rows = list(enumerate(reader, start=row_number))
+    return rows, offset + len(data), reader.fieldnames
+
+
+def import_appended_matches(directory, state, batch_size=50, progress=None, fuzzy=False):
+    """
+    Import rows appended to the match CSV files of a directory since the last call.
+    Rows are imported in upsert mode with small batches, each committed on its own.
+    A file is read again from the start once the database file it was imported into was replaced
+    (rebuild_database_file), rows already present in the new one are skipped.
+    :param directory: directory with match CSV files
+    :param state: dict file name -> {'offset', 'rows', 'fieldnames', 'occurrences', 'database'}, updated in place;
+        occurrences counts identical rows read before (see import_match_rows), so a repeated row
+        appended later gets its own content hash; database is the get_database_file_id the rows went to
+    :param batch_size: number of matches per transaction
+    :param progress: callable receiving import progress events, see import_match_rows
+    :param fuzzy: accept misspelled player names, see import_match_rows
+    :return: dict file name -> import counts for files with new rows
+    """
+    imported = {}
+    reconnect_replaced_database()
+    database_file_id = get_database_file_id()
+    for name in sorted(os.listdir(directory)):
+        file_path = os.path.join(directory, name)
+        if not name.endswith('.csv') or not os.path.isfile(file_path):
+            continue
 
+        new_state = {'offset': 0, 'rows': 0, 'fieldnames': None, 'occurrences': {}, 'database': database_file_id}
+        file_state = state.get(name, new_state)
+        size = os.path.getsize(file_path)
+        if size < file_state['offset'] or file_state.get('database') != database_file_id:
+            # file was truncated or replaced, or its rows went to a replaced database: read it again from the start
+            file_state = new_state
+        if size == file_state['offset']:
+            continue
 
-def reset_content():
+        rows, offset, fieldnames = read_appended_csv_rows(file_path, file_state['offset'],
+                                                          file_state['fieldnames'], file_state['rows'])
+        occurrences = dict(file_state.get('occurrences', {}))
+        if rows:
+            try:
+                imported[name] = import_match_rows(rows, batch_size=batch_size, upsert=True, progress=progress,
+                                                   occurrences=occurrences, fuzzy=fuzzy)
+            except DatabaseReplacedError:
+                # the state of this file is kept, files of the previous database are read again on the next call
+                reconnect_replaced_database()
+                return imported
+        state[name] = {'offset': offset, 'rows': file_state['rows'] + len(rows), 'fieldnames': fieldnames,
+                       'occurrences': occurrences, 'database': database_file_id}
+    return imported
+
+
+def reset_content(progress=None):
     # must be invoked inside app context
+    # progress: optional callable receiving stage and match import events
+    report = progress or (lambda event: None)
     delete_all()
 
+    report({'event': 'stage', 'stage': 'results'})
     actual_results_path = current_app.config.get('ACTUAL_RESULTS_JSON', 'data/actual_results.json')
     with open(actual_results_path) as f:
         input_data_from_json(f)
 
-    seasons = Season.query.order_by('date_end').all()
-    for s in seasons:
-        if s.is_ranked:
-            calculate_rankings(s.date_end)
+    report({'event': 'stage', 'stage': 'rankings'})
+    rebuild_rankings()
 
+    report({'event': 'stage', 'stage': 'seasons'})
     init_seasons_data()
+    publish_ranking_snapshot()
+
+    report({'event': 'stage', 'stage': 'matches'})
+    import_matches_from_csv(current_app.config.get('MATCHES_CSV', 'data/all_matches.csv'), progress=progress)
+
+
+def get_database_file():
+    """Path of the SQLite database file of the current app, None for other databases"""
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
 
-    import_matches_from_csv('data/all_matches.csv')
+def get_database_file_id():
+    """
+    (device, inode) of the SQLite database file, changes when rebuild_database_file replaces it.
+    :return: list, None for other databases
+    """
+    path = get_database_file()
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_dev, st.st_ino]
+
+
+class DatabaseReplacedError(RuntimeError):
+    """The database file was replaced while an import was writing to it"""
+
+
+def get_data_checksum():
+    """
+    Checksum of everything reset_content builds the database from:
+    data files, ranking settings and the table layout.
+    Must be invoked inside app context.
+    """
+    checksum = hashlib.sha256()
+    paths = [current_app.config.get('ACTUAL_RESULTS_JSON', 'data/actual_results.json'),
+             current_app.config.get('MATCHES_CSV', 'data/all_matches.csv'),
+             seasons_data.__file__]
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                checksum.update(chunk)
+    for key in ('RANKING_STORAGE', 'RANKING_RULES'):
+        checksum.update(f"{key}={current_app.config.get(key)}".encode())
+    checksum.update(repr([(t.name, [c.name for c in t.columns]) for t in db.metadata.sorted_tables]).encode())
+    return checksum.hexdigest()
+
+
+def build_database_file(path, season_aliases=(), progress=None):
+    """
+    Build a complete database in a new SQLite file with the whole import and ranking pipeline.
+    The file stores the data checksum it was built from and query planner statistics.
+    Must be invoked inside app context, the current database is not touched.
+    :param path: file to create, an existing file is overwritten
+    :param season_aliases: (alias, season id) pairs stored before content is loaded
+    :param progress: optional callable receiving progress events, see reset_content
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+    # the live app publishes the ranking snapshot once the file is in use
+    config = dict(current_app.config, SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.abspath(path)}",
+                  RANKING_SNAPSHOT='')
+    build_app = create_app(SimpleNamespace(**config))
+    try:
+        with build_app.app_context():
+            db.create_all()
+            db.session.add_all(SeasonAlias(alias=alias, season_id=season_id) for alias, season_id in season_aliases)
+            db.session.commit()
+            invalidate_season_aliases()
+            reset_content(progress=progress)
+            set_fingerprint(CONTENT_FINGERPRINT, get_data_checksum())
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+            db.session.remove()
+            db.engine.dispose()
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    finally:
+        invalidate_season_aliases()
+        invalidate_ranking_index()
+        invalidate_player_name_index()
+        bump_data_version()
+
+
+def rebuild_database_file(progress=None):
+    """
+    Blue/green content reload of a SQLite database file.
+    The whole import and ranking pipeline runs against a new file next to the live one,
+    which then atomically replaces it. Readers keep using the previous file until they reconnect.
+    Must be invoked inside app context.
+    :param progress: optional callable receiving progress events, see reset_content
+    :return: path of the replaced database file
+    """
+    live_path = get_database_file()
+    if live_path is None:
+        raise ValueError(f"Blue/green rebuild needs a SQLite database file, got {db.engine.url}")
+    build_path = live_path + '.build'
+
+    # aliases are not part of the content, carry them over
+    build_database_file(build_path, [(a.alias, a.season_id) for a in SeasonAlias.query], progress=progress)
+
+    os.replace(build_path, live_path)
+    db.session.remove()
+    db.engine.dispose()
+    publish_ranking_snapshot()
+    return live_path
+
+
+def database_has_content():
+    """True if the current database has leagues, i.e. was loaded before. Must be invoked inside app context."""
+    return inspect(db.engine).has_table(League.__tablename__) and League.query.first() is not None
+
+
+def load_database_snapshot(snapshot_path, force=False):
+    """
+    Copy a database file made by build_database_file into the current SQLite database
+    with the sqlite backup API, if it was built from the current data.
+    Must be invoked inside app context.
+    :param snapshot_path: snapshot database file
+    :param force: also replace a database that has content; matches imported and rankings
+        recalculated since the snapshot was built are lost
+    :return: True if the snapshot was loaded, False if it is missing or stale or the database has content
+    """
+    live_path = get_database_file()
+    if live_path is None or not os.path.exists(snapshot_path):
+        return False
+    if not force and database_has_content():
+        return False
+
+    source = sqlite3.connect(f"file:{os.path.abspath(snapshot_path)}?mode=ro", uri=True)
+    try:
+        try:
+            row = source.execute('SELECT checksum FROM DataFingerprint WHERE name = ?',
+                                 (CONTENT_FINGERPRINT,)).fetchone()
+        except sqlite3.DatabaseError:
+            row = None
+        if row is None or row[0] != get_data_checksum():
+            return False
+
+        db.session.remove()
+        db.engine.dispose()
+        target = sqlite3.connect(live_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+    invalidate_ranking_index()
+    invalidate_season_aliases()
+    invalidate_player_name_index()
+    bump_data_version()
+    publish_ranking_snapshot()
+    return True
+
+
+def resolve_match_divisions():
+    """
+    Resolve the division of every stored match again against the current results,
+    matches whose players no longer share a division of the season keep no division.
+    :return: number of matches whose division changed
+    """
+    season_divisions = load_season_divisions()
+    changes = []
+    query = db.session.query(Match.id, Match.division_id, Match.player1_id, Match.player2_id, Match.season_id)
+    for match_id, current_id, player1_id, player2_id, season_id in query:
+        division_id = select_match_division(season_divisions, player1_id, player2_id, season_id)
+        if division_id != current_id:
+            changes.append({'id': match_id, 'division_id': division_id})
+    if changes:
+        db.session.execute(update(Match), changes)
+        db.session.commit()
+        bump_data_version()
+    return len(changes)
+
+
+def rebuild_matches():
+    """
+    Bring stored matches up to date with the current players, seasons and results.
+    Rows of MATCHES_CSV that were not imported yet are added and the divisions of all stored
+    matches, including those imported from watched and other files, are resolved again.
+    Stored matches are never deleted: their source files are not known here.
+    """
+    import_matches_from_csv(current_app.config.get('MATCHES_CSV', 'data/all_matches.csv'), upsert=True)
+    resolve_match_divisions()
+
+
+def config_fingerprint(*keys):
+    return ';'.join(f"{key}={current_app.config.get(key)}" for key in keys)
+
+
+# derived data rebuilt by 'manage.py build' when its inputs change
+BUILD_NODES = [
+    BuildNode('rankings',
+              inputs=lambda: [table_fingerprint(League), table_fingerprint(Season), table_fingerprint(Division),
+                              table_fingerprint(Result), table_fingerprint(Player, ['id', 'gender']),
+                              config_fingerprint('RANKING_RULES', 'RANKING_STORAGE')],
+              run=lambda: rebuild_rankings()),
+    BuildNode('matches',
+              inputs=lambda: [file_fingerprint(current_app.config.get('MATCHES_CSV', 'data/all_matches.csv')),
+                              table_fingerprint(Player, ['id', 'first_name', 'last_name']),
+                              table_fingerprint(Season, ['id']), table_fingerprint(Division),
+                              table_fingerprint(Result, ['id', 'player_id', 'division_id']),
+                              table_fingerprint(SeasonAlias)],
+              run=rebuild_matches),
+]
+
+
+def reload_content_job(progress):
+    """Job: reload content, a SQLite database file is rebuilt aside and swapped in"""
+    if get_database_file() is not None:
+        rebuild_database_file(progress=progress)
+        return {'swapped': True}
+    reset_content(progress=progress)
+    return {'swapped': False}
+
+
+def import_matches_job(progress, upsert=True, fuzzy=False):
+    """Job: import the configured matches CSV"""
+    return import_matches_from_csv(current_app.config.get('MATCHES_CSV', 'data/all_matches.csv'),
+                                   upsert=upsert, progress=progress, fuzzy=fuzzy)
+
+
+def rebuild_rankings_job(progress):
+    """Job: recalculate all ranking snapshots"""
+    return {'rows': rebuild_rankings()}
+
+
+def update_rankings_job(progress, season_ids=None):
+    """Job: recalculate ranking snapshots affected by changed results"""
+    return {'dates': [d.isoformat() for d in update_rankings(season_ids=season_ids)]}
+
+
+def id_list(value):
+    """Job parameter: list of integer ids, raises ValueError for anything else"""
+    if not isinstance(value, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+        raise ValueError('expected a list of integer ids')
+    return value
+
+
+# job type -> (function, parameters accepted from the request: name -> converter raising ValueError)
+JOB_TYPES = {
+    'reload-data': (reload_content_job, {}),
+    'import-matches': (import_matches_job, {'upsert': bool, 'fuzzy': bool}),
+    'rebuild-rankings': (rebuild_rankings_job, {}),
+    'update-rankings': (update_rankings_job, {'season_ids': id_list}),
+}
+
+
+_database_file_ids = {}
+
+
+@app.before_request
+def reconnect_replaced_database():
+    """
+    Reconnect and drop process caches once the database file was replaced by rebuild_database_file.
+    Runs before every request and every scan of the match watcher.
+    """
+    path = get_database_file()
+    file_id = get_database_file_id()
+    if file_id is None:
+        return
+    previous = _database_file_ids.setdefault(path, file_id)
+    if previous != file_id:
+        _database_file_ids[path] = file_id
+        db.session.remove()
+        db.engine.dispose()
+        invalidate_ranking_index()
+        invalidate_season_aliases()
+        invalidate_player_name_index()
+        bump_data_version()
 
 
 @app.template_filter('to_date')
@@ -336,26 +966,17 @@ def to_date_filter(date_string):
         return None
 
 
-def transliterate(text):
-    # Russian transliteration mapping (ISO 9 standard)
-    translit_dict = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
-        'ъ': '', 'ы': 'y', 'ь': "'", 'э': 'e', 'ю': 'yu', 'я': 'ya',
-        'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'Yo',
-        'Ж': 'Zh', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
-        'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
-        'Ф': 'F', 'Х': 'Kh', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Щ': 'Sch',
-        'Ъ': '', 'Ы': 'Y', 'Ь': "'", 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya'
-    }
+def get_partition_title(partition):
+    titles = {ALL_PARTITION: 'Общий', 'gender:male': 'Мужчины', 'gender:female': 'Женщины'}
+    if partition in titles:
+        return titles[partition]
 
-    result = []
-    for char in text:
-        result.append(translit_dict.get(char, char))
-    return ''.join(result)
+    if partition.startswith('league:'):
+        league = db.session.get(League, int(partition.partition(':')[2]))
+        if league:
+            return league.name
 
+    return partition
 
 
 @app.route('/')
@@ -364,40 +985,134 @@ def index():
 
 
 @app.route('/rankings')
+@cached_page
 def show_rankings():
     """Display rankings with date and season filtering"""
+    season_id = request.args.get('season_id', type=int)
+    selected_date = request.args.get('date', type=to_date_filter)
+
+    # current rankings are served from the snapshot shared by all workers
+    snapshot = get_ranking_snapshot() if not season_id and not selected_date else None
+    if snapshot is not None and snapshot.page['actual_date'] is not None:
+        page = snapshot.page
+        partition = request.args.get('partition', ALL_PARTITION)
+        if partition not in page['partitions']:
+            partition = ALL_PARTITION
+        return render_template('rankings.html',
+                               actual_date=page['actual_date'],
+                               rankings=page['rankings'].get(partition, []),
+                               seasons=page['seasons'],
+                               selected_season_id=season_id,
+                               selected_date=selected_date,
+                               partitions=[(p, get_partition_title(p)) for p in page['partitions']],
+                               selected_partition=partition)
+
     latest_season = Season.query.filter(Season.is_completed == True, Season.is_ranked == True) \
         .order_by(Season.date_end.desc()).first()
 
     if not latest_season:
         # handle empty DB gracefully
-        return render_template('rankings.html', actual_date=None, rankings=[], seasons=[], selected_season_id=None)
+        return render_template('rankings.html', actual_date=None, rankings=[], seasons=[], selected_season_id=None,
+                               selected_date=None, partitions=[], selected_partition=ALL_PARTITION)
 
     actual_date = latest_season.date_end
 
     # Get filters from request
-    season_id = request.args.get('season_id', type=int)
     if season_id:
         season = db.session.get(Season, season_id)
         if season:
             actual_date = season.date_end
 
+    partitions = get_stored_partitions()
+    partition = request.args.get('partition', ALL_PARTITION)
+    if partition not in partitions:
+        partition = ALL_PARTITION
+
     # Get available seasons for dropdown
     seasons = Season.query.order_by(Season.id.desc()).filter(Season.is_ranked == True) \
         .filter(Season.is_completed == True).all()
 
     # Get rankings
-    rankings = Ranking.query.filter_by(actual_date=actual_date).order_by('position').all()
-    rankings_data = [p.to_dict() for p in rankings]
+    if selected_date:
+        actual_date = selected_date
+        rankings_data = get_rankings_at(selected_date, partition)
+    else:
+        rankings_data = get_rankings_data(actual_date, partition)
 
     return render_template('rankings.html',
                            actual_date=actual_date,
                            rankings=rankings_data,
                            seasons=seasons,
-                           selected_season_id=season_id)
+                           selected_season_id=season_id,
+                           selected_date=selected_date,
+                           partitions=[(p, get_partition_title(p)) for p in partitions],
+                           selected_partition=partition)
+
+
+@app.route('/api/rankings')
+def api_rankings():
+    """Ranking table at any date (?date=YYYY-MM-DD), today by default, optionally for a ?partition="""
+    date = request.args.get('date', type=to_date_filter) or datetime.now().date()
+    partition = request.args.get('partition', ALL_PARTITION)
+    if partition != ALL_PARTITION and partition not in get_stored_partitions():
+        return jsonify({'error': f'Unknown partition: {partition}'}), 404
+
+    rankings_data = get_rankings_at(date, partition)
+    for r in rankings_data:
+        r['actual_date'] = r['actual_date'].isoformat()
+        r['last_result_date'] = r['last_result_date'].isoformat()
+
+    return jsonify({'date': date.isoformat(), 'partition': partition, 'rankings': rankings_data})
+
+
+def jobs_token_required(view):
+    """Answer 403 unless the X-Jobs-Token header matches JOBS_TOKEN, job reports contain tracebacks and CSV rows"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('JOBS_TOKEN')
+        if not token or not hmac.compare_digest(request.headers.get('X-Jobs-Token', ''), token):
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@app.route('/api/jobs', methods=['GET'])
+@jobs_token_required
+def api_jobs():
+    """Status of recent background jobs, requires X-Jobs-Token header matching JOBS_TOKEN"""
+    return jsonify({'jobs': [job.to_dict() for job in job_runner.jobs()]})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@jobs_token_required
+def api_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs', methods=['POST'])
+@jobs_token_required
+def api_start_job():
+    """Start a background job: {"type": "reload-data"}, requires X-Jobs-Token header matching JOBS_TOKEN"""
+    data = request.get_json(silent=True) or {}
+    job_type = data.get('type')
+    if job_type not in JOB_TYPES:
+        return jsonify({'error': f'Unknown job type: {job_type}', 'types': sorted(JOB_TYPES)}), 400
+    func, converters = JOB_TYPES[job_type]
+    try:
+        params = {name: convert(data[name]) for name, convert in converters.items() if name in data}
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameters for {job_type}: {e}'}), 400
+
+    job = job_runner.submit(current_app._get_current_object(), job_type, func, **params)
+    return jsonify(job.to_dict()), 202, {'Location': f'/api/jobs/{job.id}'}
 
 
 @app.route('/results')
+@cached_page
 def show_results():
     # Get filters from request
     season_id = request.args.get('season_id', type=int)
@@ -440,6 +1155,8 @@ def show_season_application():
     division_name = request.args.get('division_name', type=str)
 
     application_path = current_app.config.get('APPLICATION_CSV')
+    # also players whose results expired, Ranking only holds the current snapshot with delta storage
+    last_rankings = load_last_rankings()
 
     with open(application_path) as f:
         csv_reader = csv.DictReader(f)
@@ -460,14 +1177,16 @@ def show_season_application():
 
             player = Player.query.filter(
                 (Player.first_name == player_name) & (Player.last_name == player_surname)).first()
+            if player is None:
+                player_id = get_player_name_index().resolve(player_str)
+                player = db.session.get(Player, player_id) if player_id else None
             if player:
                 player_dict['player_id'] = player.id
 
-                ranking = Ranking.query.filter(Ranking.player_id == player.id).order_by(
-                    Ranking.actual_date.desc()).first()
+                ranking = last_rankings.get(player.id)
                 if ranking:
-                    player_dict['ranking'] = ranking.to_dict()['position']
-                    player_dict['qualification'] = ranking.to_dict()['new_division']
+                    player_dict['ranking'] = ranking.position
+                    player_dict['qualification'] = db.session.get(Result, ranking.last_result_id).get_new_division()
                 else:
                     player_dict['qualification'] = 'NEW'
 
@@ -556,18 +1275,13 @@ def show_schedule():
 
 
 @app.route('/player/<int:player_id>')
+@cached_page
 def player_profile(player_id):
     """Display player profile with statistics and history"""
     player = db.get_or_404(Player, player_id)
 
-    # Get current position
-    current_position = player.get_current_position()
-
-    # Get current division
-    if player.get_current_ranking():
-        new_division = player.get_current_ranking().get_new_division()
-    else:
-        new_division = None
+    # Get current position and division
+    current_position, new_division = get_current_rankings().get(player_id, (None, None))
 
     # Get season results
     season_results = player.get_results()
@@ -639,6 +1353,7 @@ def player_matches(player_id):
             h2h_stats = calculate_h2h_stats(player_id, opponent_id)
 
     # Format match data
+    ranking_index = get_ranking_index()
     match_history = []
     for match in matches:
         is_player1 = match.player1_id == player_id
@@ -662,7 +1377,9 @@ def player_matches(player_id):
             'date': match.date_played,
             'division': match.division.name,
             'season': match.division.season_ref.name,
-            'year': match.division.season_ref.year
+            'year': match.division.season_ref.year,
+            'player_rank': ranking_index.position_at(player_id, match.date_played),
+            'opponent_rank': ranking_index.position_at(opponent.id, match.date_played),
         })
 
     # Get filter options
@@ -683,40 +1400,32 @@ def player_matches(player_id):
 
 @app.route('/api/search-players')
 def search_players():
-    query = transliterate(request.args.get('q', '').lower().strip())
+    query = request.args.get('q', '').strip()
 
     if not query or len(query) < 2:
         return jsonify([])
 
+    # over the limit only results cached anyway are returned, the client keeps its previous list
+    allowed, retry_after = search_limiter.allow(request.remote_addr)
     try:
-        search_terms = query.strip().split()
-
-        if len(search_terms) == 1:
-            players = Player.query.filter(
-                (Player.first_name.ilike(f'%{query}%')) |
-                (Player.last_name.ilike(f'%{query}%'))
-            ).limit(10).all()
-        else:
-            # Multi-term search - combine first and last name
-            players = Player.query.filter(
-                or_(
-                    # Search for first term in first name and second term in last name
-                    (Player.first_name.ilike(f'%{search_terms[0]}%') &
-                     Player.last_name.ilike(f'%{search_terms[1]}%')),
-                    # Reverse order
-                    (Player.first_name.ilike(f'%{search_terms[1]}%') &
-                     Player.last_name.ilike(f'%{search_terms[0]}%'))
-                )
-            ).limit(10).all()
+        players = get_player_search_index().search(query, limit=10, cached_only=not allowed)
+        if players is None:
+            response = jsonify([])
+            response.status_code = 429
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response
 
         results = [{
-            'id': p.id,
-            'first_name': p.first_name,
-            'last_name': p.last_name,
-            'current_rating': p.current_position or '-'
+            'id': p['id'],
+            'first_name': p['first_name'],
+            'last_name': p['last_name'],
+            'current_rating': p['position'] or '-'
         } for p in players]
 
-        return jsonify(results)
+        response = jsonify(results)
+        # results only change with the data, let browsers reuse them while the user backspaces
+        response.headers['Cache-Control'] = f"public, max-age={current_app.config.get('SEARCH_CACHE_MAX_AGE', 300)}"
+        return response
 
     except Exception as e:
         print(f"Search error: {e}")
@@ -724,6 +1433,7 @@ def search_players():
 
 
 @app.route('/season/<season_id>/rules')
+@cached_page
 def season_rules(season_id):
     season = db.get_or_404(Season, season_id)
 
@@ -736,7 +1446,9 @@ if __name__ == '__main__':
     with app.app_context():
         db.create_all()
 
-        if not League.query.first() or app.config.get('DEBUG'):  # always reseting content in dev
+        if load_database_snapshot(app.config['DATABASE_SNAPSHOT']):
+            print(f"Loaded database snapshot {app.config['DATABASE_SNAPSHOT']}")
+        elif not League.query.first() or app.config.get('DEBUG'):  # always reseting content in dev
             reset_content()
 
     # Use config-driven debug mode
@@ -0,0 +1,149 @@
+"""
+Build graph of derived data (rankings, imported matches).
+Every node stores the fingerprint of its inputs in DataFingerprint after it was built,
+so a build recomputes only the nodes whose inputs changed since.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from extensions import db
+from models import get_fingerprint, set_fingerprint
+
+FINGERPRINT_PREFIX = 'build:'
+
+
+class BuildNode:
+    """Derived artifact: how to fingerprint its inputs and how to build it"""
+
+    def __init__(self, name, inputs, run, deps=(), writes=True):
+        """
+        :param name: node name
+        :param inputs: callable returning a list of input fingerprints (strings), run inside app context
+        :param run: callable building the artifact, run inside app context
+        :param deps: names of nodes that must be built before this one
+        :param writes: run writes to the database, see run_build
+        """
+        self.name = name
+        self.inputs = inputs
+        self.run = run
+        self.deps = tuple(deps)
+        self.writes = writes
+
+    def fingerprint(self):
+        checksum = hashlib.sha256()
+        for part in self.inputs():
+            checksum.update(part.encode())
+            checksum.update(b'\0')
+        return checksum.hexdigest()
+
+    def stored_fingerprint(self):
+        return get_fingerprint(FINGERPRINT_PREFIX + self.name)
+
+    def mark_built(self, fingerprint=None):
+        set_fingerprint(FINGERPRINT_PREFIX + self.name, fingerprint or self.fingerprint())
+
+
+def table_fingerprint(model, columns=None):
+    """
+    Checksum of table content in primary key order.
+    :param model: db.Model class
+    :param columns: column names to include, all columns by default
+    """
+    table = model.__table__
+    selected = [table.c[name] for name in columns] if columns else list(table.c)
+    checksum = hashlib.sha256(table.name.encode())
+    query = db.session.query(*selected).order_by(*table.primary_key.columns).execution_options(yield_per=1000)
+    for row in query:
+        checksum.update(repr(tuple(row)).encode())
+    return checksum.hexdigest()
+
+
+def file_fingerprint(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def build_levels(nodes):
+    """
+    Group nodes into levels, each node after all of its dependencies.
+    :return: list of lists of nodes
+    :raises ValueError: unknown dependency or dependency cycle
+    """
+    names = {node.name for node in nodes}
+    for node in nodes:
+        unknown = set(node.deps) - names
+        if unknown:
+            raise ValueError(f"Unknown dependencies of {node.name}: {sorted(unknown)}")
+
+    levels = []
+    done = set()
+    pending = list(nodes)
+    while pending:
+        level = [node for node in pending if set(node.deps) <= done]
+        if not level:
+            raise ValueError(f"Dependency cycle between {sorted(node.name for node in pending)}")
+        levels.append(level)
+        done.update(node.name for node in level)
+        pending = [node for node in pending if node.name not in done]
+    return levels
+
+
+def run_build(app, nodes, force=(), jobs=2, dry_run=False):
+    """
+    Build the nodes whose inputs changed since they were built, independent nodes concurrently.
+    A node is also built (or reported stale) if a node it depends on was built in this run.
+    SQLite allows one writer at a time, so on SQLite nodes that write are run one after another.
+    :param app: Flask app, every node runs in its own app context
+    :param nodes: list of BuildNode
+    :param force: names of nodes to build even if they are up to date
+    :param jobs: max number of nodes built at the same time
+    :param dry_run: only report which nodes are stale
+    :return: list of (node name, status, seconds), status is one of fresh, stale, built, failed
+    """
+    built = set()
+    failed = set()
+    report = []
+    with app.app_context():
+        single_writer = db.engine.dialect.name == 'sqlite'
+    write_lock = threading.Lock()
+
+    def build_node(node):
+        started = time.time()
+        with app.app_context():
+            try:
+                if set(node.deps) & failed:
+                    return node.name, 'failed', 0.
+                fingerprint = node.fingerprint()
+                stale = (node.name in force or set(node.deps) & built
+                         or fingerprint != node.stored_fingerprint())
+                if not stale:
+                    return node.name, 'fresh', time.time() - started
+                if dry_run:
+                    return node.name, 'stale', time.time() - started
+                with write_lock if single_writer and node.writes else nullcontext():
+                    node.run()
+                    # inputs as the run left them, e.g. default season aliases stored by the match import
+                    node.mark_built()
+                return node.name, 'built', time.time() - started
+            except Exception as e:
+                db.session.rollback()
+                print(f"Build of {node.name} failed: {e}")
+                return node.name, 'failed', time.time() - started
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for level in build_levels(nodes):
+            for name, status, seconds in executor.map(build_node, level):
+                report.append((name, status, seconds))
+                if status in ('built', 'stale'):
+                    built.add(name)
+                elif status == 'failed':
+                    failed.add(name)
+    return report
@@ -0,0 +1,131 @@
+"""
+Response cache of read-only pages.
+Pages depend only on the request and on the data, which changes only when an import,
+a content reload or a ranking rebuild runs. Responses are cached per route, query string
+and data version, and served with an ETag, so repeat visitors get 304 without touching the database.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, has_app_context, make_response, request
+
+from extensions import db
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'content_type', 'etag'])
+
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+
+def bump_data_version():
+    """Mark every cached response of this process as outdated, called after the data was written"""
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+    cache = get_response_cache() if has_app_context() else None
+    if cache is not None:
+        cache.clear()
+
+
+def get_data_version():
+    """
+    Version of the data seen by this process.
+    Writes of other processes (jobs in another worker, manage.py, blue/green swaps) do not bump
+    the counter of this one, so for a SQLite database the stat of the file is part of the version.
+    """
+    version = (_data_version,)
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        try:
+            st = os.stat(url.database)
+            version += (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+    return version
+
+
+class ResponseCache:
+    """Least recently used responses, bounded by number of entries and total body size"""
+
+    def __init__(self, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def init_response_cache(app):
+    """Create the response cache of app from its RESPONSE_CACHE settings, none if the cache is disabled"""
+    app.extensions['response_cache'] = ResponseCache(app.config['RESPONSE_CACHE_SIZE'],
+                                                     app.config['RESPONSE_CACHE_MAX_BYTES']) \
+        if app.config.get('RESPONSE_CACHE', True) else None
+
+
+def get_response_cache():
+    """:return: ResponseCache of the current app or None"""
+    return current_app.extensions.get('response_cache')
+
+
+def cached_page(view):
+    """
+    Cache successful responses of a view by path, query string and data version.
+    Disabled with RESPONSE_CACHE = False.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response_cache = get_response_cache()
+        if response_cache is None or not current_app.config.get('RESPONSE_CACHE', True):
+            return view(*args, **kwargs)
+
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), get_data_version())
+        entry = response_cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            body = response.get_data()
+            entry = CachedResponse(body, response.content_type, hashlib.sha1(body).hexdigest())
+            response_cache.put(key, entry)
+
+        if request.if_none_match.contains(entry.etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(entry.body, content_type=entry.content_type)
+        response.set_etag(entry.etag)
+        # let browsers revalidate on every visit, the check is cheap
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
@@ -22,6 +22,43 @@ class Config:
     # control file-based behavior (optional)
     APPLICATION_CSV = os.getenv("APPLICATION_CSV", "data/application_list_season263.csv")
     ACTUAL_RESULTS_JSON = os.getenv("ACTUAL_RESULTS_JSON", "data/actual_results.json")
+    MATCHES_CSV = os.getenv("MATCHES_CSV", "data/all_matches.csv")
+
+    # known differences between results and matches (manage.py check-consistency --update-baseline)
+    CONSISTENCY_BASELINE = os.getenv("CONSISTENCY_BASELINE", "data/consistency_baseline.txt")
+
+    # prebuilt database file (manage.py build-snapshot) loaded on start if built from the current data
+    DATABASE_SNAPSHOT = os.getenv("DATABASE_SNAPSHOT", "snapshot.db")
+
+    # file with the current rankings shared by worker processes (see ranking_snapshot.py),
+    # 'auto' puts it next to the SQLite database file, empty disables it
+    RANKING_SNAPSHOT = os.getenv("RANKING_SNAPSHOT", "auto")
+
+    # ranking history storage: 'full' keeps every snapshot in Ranking,
+    # 'delta' keeps only the current snapshot there and the history as RankingDelta rows
+    RANKING_STORAGE = os.getenv("RANKING_STORAGE", "full")
+
+    # name of the rule set from ranking.RANKING_RULES used to calculate rankings
+    RANKING_RULES = os.getenv("RANKING_RULES", "current")
+
+    # token required in X-Jobs-Token header to start and view background jobs via /api/jobs, disabled if empty
+    JOBS_TOKEN = os.getenv("JOBS_TOKEN", "")
+
+    # cache of rendered pages per data version, see cache.py
+    RESPONSE_CACHE = _env_bool("RESPONSE_CACHE", True)
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+    # player autocomplete: cached queries, seconds browsers may reuse results,
+    # requests per second and burst per client IP (0 disables the limit)
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+    SEARCH_CACHE_MAX_AGE = int(os.getenv("SEARCH_CACHE_MAX_AGE", "300"))
+    SEARCH_RATE_LIMIT = float(os.getenv("SEARCH_RATE_LIMIT", "5"))
+    SEARCH_RATE_BURST = int(os.getenv("SEARCH_RATE_BURST", "20"))
+
+    # number of reverse proxies in front of the app whose X-Forwarded-For / X-Forwarded-Proto
+    # headers are trusted (1 on Cloud Run), 0 uses the address of the connecting peer
+    TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
 
     ACTIVE_SEASON_YEAR = 2026
     ACTIVE_SEASON_NAME = 'UZ Open'
\ No newline at end of file
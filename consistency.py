@@ -0,0 +1,158 @@
+"""
+Consistency check between imported matches and division results.
+Result counters come from the JSON archive and Match rows from the CSV, so the per-player
+aggregates of the matches are computed in one grouped query and compared to the Result rows.
+Matches the import could only place by falling back to the lowest division, and rows it skipped
+because the players share no division, are reported separately.
+Known differences of historical seasons can be kept in a baseline file, so that only new ones fail the check.
+"""
+import os
+from collections import Counter, namedtuple
+
+from sqlalchemy import case, func, literal, select, union_all
+
+from extensions import db
+from models import Division, Match, Result
+
+# Result counters compared to the match aggregates
+CHECKED_FIELDS = ('match_count', 'win_count', 'set_diff', 'game_diff')
+
+Mismatch = namedtuple('Mismatch', ['division_id', 'player_id', 'field', 'matches', 'result'])
+
+
+def _won(a, b):
+    return case((a > b, 1), else_=0)
+
+
+def _side_select(me, other):
+    """
+    Per-match counters of one side of the match.
+    A royal tiebreak counts as one set and one game, as in the league tables.
+    :param me: 'player1' or 'player2'
+    :param other: the opposite side
+    """
+    table = Match.__table__
+    sets = [(table.c[f'set{n}_{me}'], table.c[f'set{n}_{other}']) for n in (1, 2, 3)]
+    royal = (table.c[f'royal_tiebreak_{me}'], table.c[f'royal_tiebreak_{other}'])
+
+    sets_won = sum((_won(a, b) for a, b in sets + [royal]), literal(0))
+    sets_lost = sum((_won(b, a) for a, b in sets + [royal]), literal(0))
+    games = sum((func.coalesce(a, 0) - func.coalesce(b, 0) for a, b in sets), literal(0))
+    games = games + _won(*royal) - _won(royal[1], royal[0])
+
+    player_id = table.c[f'{me}_id']
+    return select(
+        table.c.division_id.label('division_id'),
+        player_id.label('player_id'),
+        case((table.c.winner_id == player_id, 1), else_=0).label('win'),
+        (sets_won - sets_lost).label('set_diff'),
+        games.label('game_diff'),
+    ).where(table.c.division_id.isnot(None))
+
+
+def match_aggregates():
+    """
+    Counters of every player in every division computed from the matches.
+    :return: dict (division_id, player_id) -> dict of CHECKED_FIELDS
+    """
+    sides = union_all(_side_select('player1', 'player2'), _side_select('player2', 'player1')).subquery()
+    query = select(
+        sides.c.division_id, sides.c.player_id, func.count(), func.sum(sides.c.win),
+        func.sum(sides.c.set_diff), func.sum(sides.c.game_diff),
+    ).group_by(sides.c.division_id, sides.c.player_id)
+    return {(division_id, player_id): dict(zip(CHECKED_FIELDS, counters))
+            for division_id, player_id, *counters in db.session.execute(query)}
+
+
+def check_consistency(skipped=()):
+    """
+    Compare Result counters with the matches of divisions that have imported matches.
+    Results of divisions without any match (e.g. seasons missing in the CSV) are not checked.
+    :param skipped: 'skipped' events of an import of the match file (see app.import_match_rows),
+        rows skipped because the players have no common division in the season are reported
+    :return: dict with
+        'mismatches' - list of Mismatch of players with a Result in the division,
+        'fallback' - list of (division_id, player_id, match count) of matches the import assigned to
+            the lowest division of the winner, in which the player has no Result,
+        'no_division' - skipped events of rows without a common division,
+        'divisions' - number of checked divisions,
+        'players' - number of checked (division, player) pairs
+    """
+    aggregates = match_aggregates()
+    division_ids = {division_id for division_id, _ in aggregates}
+
+    results = {}
+    for result in db.session.query(Result.division_id, Result.player_id, *[getattr(Result, f) for f in CHECKED_FIELDS]) \
+            .filter(Result.division_id.in_(division_ids)):
+        division_id, player_id, *counters = result
+        results[(division_id, player_id)] = dict(zip(CHECKED_FIELDS, counters))
+
+    mismatches = []
+    fallback = []
+    for key in sorted(aggregates.keys() | results.keys()):
+        from_matches = aggregates.get(key, dict.fromkeys(CHECKED_FIELDS, 0))
+        from_result = results.get(key)
+        if from_result is None:
+            fallback.append((key[0], key[1], from_matches['match_count']))
+            continue
+        for field in CHECKED_FIELDS:
+            if (from_result[field] or 0) != from_matches[field]:
+                mismatches.append(Mismatch(key[0], key[1], field, from_matches[field], from_result[field]))
+
+    return {
+        'mismatches': mismatches,
+        'fallback': fallback,
+        'no_division': [event for event in skipped if 'player_ids' in event],
+        'divisions': len(division_ids),
+        'players': len(aggregates.keys() | results.keys()),
+    }
+
+
+def describe_division(division_id):
+    division = db.session.get(Division, division_id)
+    return f"{division.season_ref.get_title()} / {division.name}" if division else str(division_id)
+
+
+def describe_differences(report, player_name):
+    """
+    Differences of a check_consistency report as text lines. Divisions and players are named rather
+    than referenced by id and skipped rows by their content rather than row number, so the lines
+    stay the same after the content is reloaded or rows are appended to the match file.
+    :param player_name: callable player_id -> display name
+    :return: list of lines, mismatches first, then fallback divisions and rows without a common division
+    """
+    lines = [f"{describe_division(m.division_id)}, {player_name(m.player_id)}: "
+             f"{m.field} matches {m.matches}, result {m.result}" for m in report['mismatches']]
+    lines += [f"{describe_division(division_id)}, {player_name(player_id)}: {count} match(es) "
+              f"without a result in the division" for division_id, player_id, count in report['fallback']]
+    lines += [event['reason'] for event in report['no_division']]
+    return lines
+
+
+def load_baseline(path):
+    """:return: Counter of the difference lines stored in the baseline file, empty if it does not exist"""
+    if not path or not os.path.exists(path):
+        return Counter()
+    with open(path, encoding='utf-8') as f:
+        return Counter(line.rstrip('\n') for line in f if line.strip())
+
+
+def save_baseline(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{line}\n" for line in sorted(lines))
+
+
+def new_differences(lines, baseline):
+    """
+    :param lines: differences from describe_differences
+    :param baseline: Counter from load_baseline
+    :return: lines not covered by the baseline, in their order
+    """
+    known = Counter(baseline)
+    new = []
+    for line in lines:
+        if known[line] > 0:
+            known[line] -= 1
+        else:
+            new.append(line)
+    return new
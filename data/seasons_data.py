@@ -1,5 +1,6 @@
 from models import Season
 from extensions import db
+from cache import bump_data_version
 
 
 SEASONS_INFO = {
@@ -304,4 +305,5 @@ def init_seasons_data():
 
     db.session.add_all(new_seasons)
 
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+    bump_data_version()
\ No newline at end of file
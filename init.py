@@ -1,4 +1,6 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+from cache import init_response_cache
 from config import Config
 from extensions import db, bootstrap
 
@@ -13,5 +15,11 @@ def create_app(config=None):
     # Initialize extensions
     db.init_app(app)
     bootstrap.init_app(app)
+    init_response_cache(app)
 
-    return app
\ No newline at end of file
+    # behind reverse proxies the client address is the one they add to X-Forwarded-For
+    proxies = app.config.get('TRUSTED_PROXIES', 0)
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+    return app
@@ -0,0 +1,144 @@
+"""
+In-process runner for long data jobs (imports, content reloads, ranking rebuilds).
+Jobs run one at a time in a background thread, each inside its own app context and
+database session, and record their progress for the /api/jobs status endpoint.
+"""
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from extensions import db
+
+# events about single input rows, kept apart so they do not push out batch events
+ROW_EVENTS = ('skipped', 'resolved', 'row_error')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    """State and progress of one submitted job"""
+
+    def __init__(self, job_type, params, max_events=50):
+        self.id = uuid.uuid4().hex[:12]
+        self.type = job_type
+        self.params = params
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.events = deque(maxlen=max_events)
+        self.row_events = deque(maxlen=max_events)
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def report(self, event):
+        """
+        Progress callback passed to the job function.
+        Counters of the latest event are kept as job progress, the event itself in a short history.
+        :param event: dict with 'event' key and counters
+        """
+        with self._lock:
+            event = dict(event, time=time.time())
+            if event['event'] in ROW_EVENTS:
+                self.row_events.append(event)
+                return
+            self.events.append(event)
+            self.progress.update((k, v) for k, v in event.items()
+                                 if isinstance(v, (int, float)) and not isinstance(v, bool) and k not in ('row', 'time'))
+
+    def to_dict(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.
+            rows = self.progress.get('rows')
+            return {
+                'id': self.id,
+                'type': self.type,
+                'params': self.params,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed': round(elapsed, 3),
+                'progress': dict(self.progress),
+                'throughput': round(rows / elapsed, 1) if rows and elapsed else None,
+                'result': self.result,
+                'error': self.error,
+                'events': list(self.events)[-10:],
+                'row_events': list(self.row_events)[-10:],
+            }
+
+
+class JobRunner:
+    """Runs submitted jobs in a single background thread, so writes never overlap"""
+
+    def __init__(self, max_jobs=100):
+        self._executor = None
+        self._jobs = {}
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+
+    def submit(self, app, job_type, func, **params):
+        """
+        Queue a job.
+        :param app: Flask app the job runs in
+        :param job_type: name shown in the status
+        :param func: callable(progress, **params) run inside app context
+        :return: Job
+        """
+        job = Job(job_type, params)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jobs')
+            self._jobs[job.id] = job
+            # forget the oldest finished jobs
+            finished = [j for j in self._jobs.values() if j.status in (DONE, FAILED)]
+            for old in finished[:max(0, len(self._jobs) - self._max_jobs)]:
+                del self._jobs[old.id]
+            self._executor.submit(self._run, app, job, func)
+        return job
+
+    @staticmethod
+    def _run(app, job, func):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            with app.app_context():
+                try:
+                    job.result = func(job.report, **job.params)
+                finally:
+                    db.session.remove()
+            job.status = DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.report({'event': 'failed', 'error': job.error, 'traceback': traceback.format_exc()})
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        """Submitted jobs, newest first"""
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def wait(self, timeout=None):
+        """Block until queued jobs are finished (used by tests and the CLI)"""
+        deadline = None if timeout is None else time.time() + timeout
+        while any(j.status in (QUEUED, RUNNING) for j in list(self._jobs.values())):
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+
+job_runner = JobRunner()
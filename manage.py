@@ -3,15 +3,38 @@
 Simple CLI for maintenance tasks: import-data and reset-db.
 Usage:
   python manage.py import-data path/to/file.json
+  python manage.py import-matches path/to/matches.csv [--no-upsert] [--fuzzy]
+  python manage.py watch-matches path/to/dir [--interval SECONDS] [--once] [--fuzzy]
+  python manage.py check-consistency [--limit N] [--baseline PATH] [--update-baseline]
+  python manage.py add-season-alias "Raketo season name" SEASON_ID
+  python manage.py season-aliases
   python manage.py reset-db
+  python manage.py reload-data [--swap]
+  python manage.py build-snapshot [PATH]
+  python manage.py load-snapshot [PATH] [--no-rebuild] [--force]
+  python manage.py update-rankings [--season-id ID ...]
+  python manage.py rebuild-rankings [--jobs N]
+  python manage.py compare-rules current half-year-expiry [--date YYYY-MM-DD]
+  python manage.py build [--force NODE ...] [--dry-run]
 """
+import os
+import copy
+import json
+import time
 import click
 from init import create_app
 
 app = create_app()
 
 # import functions from app module (they expect to run inside app_context)
-from app import input_data_from_json, delete_all, reset_content
+from app import input_data_from_json, import_matches_from_csv, import_appended_matches, delete_all, reset_content, \
+    rebuild_database_file, build_database_file, load_database_snapshot, database_has_content, update_rankings, \
+    rebuild_rankings, BUILD_NODES
+from build import run_build
+from consistency import check_consistency, describe_differences, load_baseline, save_baseline, new_differences
+from extensions import db
+from models import Player, Season, get_season_aliases, set_season_alias
+from ranking import RANKING_RULES, load_result_rows, get_ranking_dates, compare_rule_sets
 
 @click.group()
 def cli():
@@ -29,6 +52,120 @@ def import_data(path):
         click.echo("Import finished.")
 
 
+@cli.command("import-matches")
+@click.argument("path", type=click.Path(exists=True))
+@click.option("--upsert/--no-upsert", default=True, show_default=True,
+              help="Skip rows that were already imported from an earlier version of the file.")
+@click.option("--fuzzy", is_flag=True,
+              help="Import rows with misspelled player names as matches of the closest player.")
+def import_matches(path, upsert, fuzzy):
+    """Import match results from CSV file PATH."""
+    with app.app_context():
+        counts = import_matches_from_csv(path, upsert=upsert, fuzzy=fuzzy)
+        click.echo(f"Imported {counts['imported']}, already imported {counts['existing']}, "
+                   f"skipped {counts['skipped']}, errors {counts['errors']}.")
+
+
+@cli.command("watch-matches")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--state", "state_path", type=click.Path(dir_okay=False),
+              help="File with read offsets of the CSV files [default: DIRECTORY/.watch-matches.json].")
+@click.option("--interval", type=float, default=30, show_default=True, help="Seconds between directory scans.")
+@click.option("--batch-size", type=int, default=50, show_default=True, help="Matches per transaction.")
+@click.option("--once", is_flag=True, help="Import appended rows once and exit.")
+@click.option("--fuzzy", is_flag=True,
+              help="Import rows with misspelled player names as matches of the closest player.")
+def watch_matches(directory, state_path, interval, batch_size, once, fuzzy):
+    """Import rows appended to match CSV files in DIRECTORY as they arrive."""
+    state_path = state_path or os.path.join(directory, ".watch-matches.json")
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    saved_state = copy.deepcopy(state)
+
+    with app.app_context():
+        while True:
+            imported = import_appended_matches(directory, state, batch_size=batch_size, fuzzy=fuzzy)
+            for name, counts in imported.items():
+                click.echo(f"{name}: imported {counts['imported']}, already imported {counts['existing']}, "
+                           f"skipped {counts['skipped']}, errors {counts['errors']}.")
+            if state != saved_state:
+                tmp_path = state_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(state, f, indent=2)
+                os.replace(tmp_path, state_path)
+                saved_state = copy.deepcopy(state)
+            if once:
+                break
+            time.sleep(interval)
+
+
+@cli.command("check-consistency")
+@click.option("--limit", type=int, default=50, show_default=True, help="New differences listed.")
+@click.option("--baseline", type=click.Path(dir_okay=False), default=None,
+              help="File of known differences, CONSISTENCY_BASELINE by default.")
+@click.option("--update-baseline", is_flag=True, help="Store the current differences as the known ones.")
+def check_consistency_command(limit, baseline, update_baseline):
+    """Compare division results with the imported matches, exit with 1 on differences not in the baseline."""
+    with app.app_context():
+        started = time.time()
+        # rows without a common division are not stored, resolve the match file again without writing
+        skipped = []
+        import_matches_from_csv(app.config["MATCHES_CSV"], upsert=True, dry_run=True,
+                                progress=lambda event: skipped.append(event) if event["event"] == "skipped" else None)
+        report = check_consistency(skipped)
+        players = {p.id: p for p in db.session.query(Player)}
+
+        def player_name(player_id):
+            player = players.get(player_id)
+            return f"{player.first_name} {player.last_name}" if player else player_id
+
+        differences = describe_differences(report, player_name)
+        baseline = baseline or app.config["CONSISTENCY_BASELINE"]
+        if update_baseline:
+            save_baseline(baseline, differences)
+            click.echo(f"Stored {len(differences)} known difference(s) in {baseline}.")
+            return
+
+        new = new_differences(differences, load_baseline(baseline))
+        for line in new[:limit]:
+            click.echo(line)
+        if len(new) > limit:
+            click.echo(f"... and {len(new) - limit} more")
+
+        mismatches, fallback, no_division = report['mismatches'], report['fallback'], report['no_division']
+        click.echo(f"Checked {report['players']} player(s) in {report['divisions']} division(s) "
+                   f"in {time.time() - started:.2f}s: {len(mismatches)} mismatch(es), "
+                   f"{sum(count for _, _, count in fallback)} match(es) in a fallback division, "
+                   f"{len(no_division)} row(s) without a common division; "
+                   f"{len(new)} difference(s) not in {baseline}.")
+        if new:
+            raise SystemExit(1)
+
+
+@cli.command("add-season-alias")
+@click.argument("alias")
+@click.argument("season_id", type=int)
+def add_season_alias(alias, season_id):
+    """Map season name ALIAS used in match files to SEASON_ID."""
+    with app.app_context():
+        season = db.session.get(Season, season_id)
+        if season is None:
+            raise click.BadParameter(f"season {season_id} does not exist", param_hint="SEASON_ID")
+        set_season_alias(alias, season_id)
+        click.echo(f"{alias} -> {season_id} ({season.name}, {season.year})")
+
+
+@cli.command("season-aliases")
+def season_aliases():
+    """List season aliases used by the match import."""
+    with app.app_context():
+        for alias, season_id in sorted(get_season_aliases().items(), key=lambda a: (a[1], a[0])):
+            click.echo(f"{season_id:>4}  {alias}")
+
+
 @cli.command("reset-db")
 @click.confirmation_option(prompt="This will delete all data. Are you sure?")
 def reset_db():
@@ -40,11 +177,117 @@ def reset_db():
 
 
 @cli.command("reload-data")
-def reload_data():
+@click.option("--swap", is_flag=True,
+              help="Build a new SQLite file and swap it in atomically instead of reloading the live database.")
+def reload_data(swap):
+    """Reload all content from the data files and recalculate rankings."""
     with app.app_context():
-        reset_content()
+        if swap:
+            path = rebuild_database_file()
+            click.echo(f"Swapped in rebuilt {path}.")
+        else:
+            reset_content()
         click.echo("Done.")
 
 
+@cli.command("build-snapshot")
+@click.argument("path", required=False)
+def build_snapshot(path):
+    """Build a ready to serve database file from the data files [default: DATABASE_SNAPSHOT]."""
+    with app.app_context():
+        path = path or app.config["DATABASE_SNAPSHOT"]
+        build_database_file(path)
+        click.echo(f"Snapshot written to {path}.")
+
+
+@cli.command("load-snapshot")
+@click.argument("path", required=False)
+@click.option("--rebuild/--no-rebuild", default=True, show_default=True,
+              help="Load content from the data files if the snapshot is missing or stale and the database is empty.")
+@click.option("--force", is_flag=True, help="Replace a database that already has content with the snapshot.")
+def load_snapshot(path, rebuild, force):
+    """Copy a snapshot built from the current data files into an empty database."""
+    with app.app_context():
+        path = path or app.config["DATABASE_SNAPSHOT"]
+        # never wipe live data (imported matches, aliases, recalculated rankings) on start
+        if not force and database_has_content():
+            click.echo("Database already has content, keeping it (--force replaces it with the snapshot).")
+            return
+        if load_database_snapshot(path, force=force):
+            click.echo(f"Loaded snapshot {path}.")
+            return
+        click.echo(f"Snapshot {path} is missing or was built from other data.")
+        if not rebuild:
+            raise SystemExit(1)
+        if database_has_content():
+            click.echo("Database already has content, keeping it.")
+            return
+        db.create_all()
+        reset_content()
+        click.echo("Content reloaded from the data files.")
+
+
+@cli.command("build")
+@click.option("--force", multiple=True, type=click.Choice([node.name for node in BUILD_NODES]),
+              help="Build the node even if its inputs did not change (may be repeated).")
+@click.option("--jobs", type=int, default=2, show_default=True, help="Number of nodes built at the same time.")
+@click.option("--dry-run", is_flag=True, help="Only list the nodes that would be built.")
+def build(force, jobs, dry_run):
+    """Rebuild derived data (rankings, matches) whose inputs changed."""
+    with app.app_context():
+        db.create_all()
+    for name, status, seconds in run_build(app, BUILD_NODES, force=force, jobs=jobs, dry_run=dry_run):
+        click.echo(f"{name:<12} {status:<6} {seconds:.2f}s")
+
+
+@cli.command("update-rankings")
+@click.option("--season-id", "season_ids", type=int, multiple=True,
+              help="Season with changed results (may be repeated). Seasons whose results changed since the "
+                   "rankings were stored are detected in any case.")
+def update_rankings_command(season_ids):
+    """Recalculate ranking snapshots starting from the earliest affected date."""
+    with app.app_context():
+        dates = update_rankings(season_ids=list(season_ids) or None)
+        if not dates:
+            click.echo("Rankings are up to date.")
+        else:
+            click.echo(f"Recalculated {len(dates)} snapshot(s) since {dates[0]}.")
+
+
+@cli.command("rebuild-rankings")
+@click.option("--jobs", type=int, default=1, show_default=True,
+              help="Number of worker processes used to calculate snapshots. Starting the pool "
+                   "costs more than the whole calculation on the current history.")
+def rebuild_rankings_command(jobs):
+    """Recalculate all ranking snapshots."""
+    with app.app_context():
+        count = rebuild_rankings(jobs=jobs)
+        click.echo(f"Written {count} ranking rows.")
+
+
+@cli.command("compare-rules")
+@click.argument("names", nargs=-1)
+@click.option("--date", "dates", type=click.DateTime(formats=["%Y-%m-%d"]), multiple=True,
+              help="Ranking date (may be repeated). All ranked season ends if omitted.")
+@click.option("--limit", type=int, default=20, show_default=True, help="Differences listed per rule set.")
+def compare_rules(names, dates, limit):
+    """Rank the result history with several rule sets, the first NAME is the baseline."""
+    unknown = [name for name in names if name not in RANKING_RULES]
+    if len(names) < 2 or unknown:
+        raise click.UsageError(f"Give at least two rule sets out of: {', '.join(RANKING_RULES)}")
+
+    with app.app_context():
+        rows = load_result_rows(filter_seasons='all')
+        dates = [d.date() for d in dates] or get_ranking_dates()
+        differences = compare_rule_sets(rows, dates, [RANKING_RULES[name] for name in names])
+        players = {p.id: p for p in db.session.query(Player)}
+
+        for name, diff in differences.items():
+            click.echo(f"{name} ({RANKING_RULES[name].description}): {len(diff)} position change(s)")
+            for date, player_id, expected, actual in diff[:limit]:
+                player = players[player_id]
+                click.echo(f"  {date} {player.first_name} {player.last_name}: {expected or '-'} -> {actual or '-'}")
+
+
 if __name__ == "__main__":
     cli()
\ No newline at end of file
@@ -1,5 +1,9 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
+import hashlib
+import re
 from sqlalchemy import Enum, CheckConstraint, func
+from cache import get_data_version
 from extensions import db
 
 
@@ -21,6 +25,31 @@ def get_division_name(priority):
     return 'O2'
 
 
+# division priority after promotion -> priority the player actually moves to
+PROMOTION_JUMPS = {200: 150, 100: 50}
+
+
+def calc_new_priority(prev_priority, relegation, step=10, double_step=20, jumps=None):
+    """
+    Division priority for the next season after relegation/promotion.
+    Defaults are the current regulations, see ranking.RankingRules for alternatives.
+    """
+    if jumps is None:
+        jumps = PROMOTION_JUMPS
+
+    if relegation == 'promoted' or relegation == 'fast promoted':
+        new_priority = prev_priority - step
+        new_priority = jumps.get(new_priority, new_priority)
+    elif relegation == 'relegated':
+        new_priority = prev_priority + step
+    elif relegation == 'double promoted':
+        new_priority = prev_priority - double_step
+    else:
+        new_priority = prev_priority
+
+    return new_priority
+
+
 class Player(db.Model):
     """Represents a tennis player in the league"""
     __tablename__ = 'Player'
@@ -51,10 +80,11 @@ class Player(db.Model):
         total_wins = sum(result.win_count for result in self.results)
         total_matches = sum(result.match_count for result in self.results)
         total_seasons = len(set(result.division_ref.season_id for result in self.results if result.division_ref))
-        if self.rankings:
-            career_high = min(ranking.position for ranking in self.rankings)
-        else:
-            career_high = None
+
+        # career high of the latest ranking covers all earlier snapshots
+        from ranking import load_last_rankings
+        latest_ranking = load_last_rankings(player_id=self.id).get(self.id)
+        career_high = latest_ranking.career_high if latest_ranking else None
 
         return {
             'total_wins': total_wins,
@@ -66,19 +96,16 @@ class Player(db.Model):
 
 
     def get_current_ranking(self):
-        actual_date = db.session.query(func.max(Ranking.actual_date)).scalar()
+        actual_date = db.session.query(func.max(Ranking.actual_date)).filter(Ranking.partition == 'all').scalar()
 
-        ranking = Ranking.query.filter_by(actual_date=actual_date).filter_by(player_id=self.id).order_by(
-            'position').first()
+        ranking = Ranking.query.filter_by(partition='all', actual_date=actual_date).filter_by(player_id=self.id) \
+            .order_by('position').first()
         return ranking
 
     def get_current_position(self):
-        """Get player's current ranking"""
-        ranking = self.get_current_ranking()
-
-        if ranking:
-            return ranking.position
-        return None
+        """Get player's current ranking position, None if not ranked"""
+        from ranking_snapshot import get_current_rankings
+        return get_current_rankings().get(self.id, (None, None))[0]
 
     def get_results(self):
         """Get all season results for the player"""
@@ -277,23 +304,7 @@ class Result(db.Model):
         return f'<Result Player {self.player_id} in Division {self.division_id}>'
 
     def calc_new_priority(self):
-        relegation = self.relegation
-        prev_priority = self.division_ref.priority
-
-        if relegation == 'promoted' or relegation == 'fast promoted':
-            new_priority = prev_priority - 10
-            if new_priority == 200:
-                new_priority = 150
-            if new_priority == 100:
-                new_priority = 50
-        elif relegation == 'relegated':
-            new_priority = prev_priority + 10
-        elif relegation == 'double promoted':
-            new_priority = prev_priority - 20
-        else:
-            new_priority = prev_priority
-
-        return new_priority
+        return calc_new_priority(self.division_ref.priority, self.relegation)
 
     def get_new_division(self):
         return get_division_name(self.calc_new_priority())
@@ -318,6 +329,8 @@ class Ranking(db.Model):
     __tablename__ = 'Ranking'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # 'all', 'gender:<gender>' or 'league:<league_id>', see ranking.get_ranking_partitions
+    partition = db.Column(db.String(32), nullable=False, default='all')
     player_id = db.Column(db.Integer, db.ForeignKey('Player.id'), nullable=True)
     position = db.Column(db.Integer, nullable=False)
     career_high = db.Column(db.Integer, nullable=True)
@@ -327,6 +340,8 @@ class Ranking(db.Model):
 
     last_result_id = db.Column(db.Integer, db.ForeignKey('Result.id'), nullable=False)
 
+    __table_args__ = (db.Index('idx_ranking_partition_date', 'partition', 'actual_date', 'position'),)
+
     def __repr__(self):
         return f'<{self.position}: {self.player_ref}>'
 
@@ -335,34 +350,102 @@ class Ranking(db.Model):
 
 
     def to_dict(self):
-        relegation_arrow = ''
-        if self.last_result_ref.relegation == 'promoted':
-            relegation_arrow = '\u21e7'  # arrow up
-        elif self.last_result_ref.relegation == 'relegated':
-            relegation_arrow = '\u21e9'  # arrow down
-        elif self.last_result_ref.relegation == 'double promoted':
-            relegation_arrow = '\u21C8'  # double arrow up
-        else:
-            relegation_arrow = '\u21CF'  # striped arrow
+        return ranking_to_dict(self.last_result_ref, self.position, self.actual_date, self.actual_season_id,
+                               ranking_id=self.id, career_high=self.career_high)
+
+
+def ranking_to_dict(last_result, position, actual_date, actual_season_id, ranking_id=None, career_high=None):
+    """Ranking table row, shared by stored Ranking rows and rankings restored from RankingDelta"""
+    relegation_arrow = ''
+    if last_result.relegation == 'promoted':
+        relegation_arrow = '\u21e7'  # arrow up
+    elif last_result.relegation == 'relegated':
+        relegation_arrow = '\u21e9'  # arrow down
+    elif last_result.relegation == 'double promoted':
+        relegation_arrow = '\u21C8'  # double arrow up
+    else:
+        relegation_arrow = '\u21CF'  # striped arrow
 
-        return {
-            'id': self.id,
-            'first_name': self.player_ref.first_name,
-            'last_name': self.player_ref.last_name,
-            'position': self.position,
-            'actual_date': self.actual_date,
-            'last_result_string':
-                f'{self.last_result_ref.division_ref.name}: {self.last_result_ref.position} {relegation_arrow}',
-            'last_season_id': self.actual_season_id,
-            'last_relegation': self.last_result_ref.relegation,
-            'last_relegation_arrow': relegation_arrow,
-            'last_division': self.last_result_ref.division_ref.name,
-            'last_position': self.last_result_ref.position,
-            'last_result_date': self.last_result_ref.division_ref.season_ref.date_end,
-            'player_id': self.player_id,
-            'new_priority': self.last_result_ref.calc_new_priority(),
-            'new_division': self.get_new_division(),
-        }
+    return {
+        'id': ranking_id,
+        'first_name': last_result.player_ref.first_name,
+        'last_name': last_result.player_ref.last_name,
+        'position': position,
+        'career_high': career_high,
+        'actual_date': actual_date,
+        'last_result_string':
+            f'{last_result.division_ref.name}: {last_result.position} {relegation_arrow}',
+        'last_season_id': actual_season_id,
+        'last_relegation': last_result.relegation,
+        'last_relegation_arrow': relegation_arrow,
+        'last_division': last_result.division_ref.name,
+        'last_position': last_result.position,
+        'last_result_date': last_result.division_ref.season_ref.date_end,
+        'player_id': last_result.player_id,
+        'new_priority': last_result.calc_new_priority(),
+        'new_division': last_result.get_new_division(),
+    }
+
+
+class RankingDelta(db.Model):
+    """
+    Change of a player's ranked result compared to the previous snapshot (compact ranking history).
+    The first snapshot is stored in full, last_result_id None means the player left the ranking.
+    Positions are not stored, they follow from the ranked results (see ranking.load_ranking_state).
+    """
+    __tablename__ = 'RankingDelta'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    partition = db.Column(db.String(32), nullable=False, default='all')
+    actual_date = db.Column(db.Date, nullable=False)
+    player_id = db.Column(db.Integer, db.ForeignKey('Player.id'), nullable=False)
+    actual_season_id = db.Column(db.Integer, db.ForeignKey('Season.id'), nullable=True)
+    last_result_id = db.Column(db.Integer, db.ForeignKey('Result.id'), nullable=True)
+
+    __table_args__ = (db.Index('idx_ranking_delta_date', 'partition', 'actual_date'),)
+
+    def __repr__(self):
+        return f'<RankingDelta {self.actual_date} {self.player_id}: {self.last_result_id}>'
+
+
+class DataFingerprint(db.Model):
+    """Checksum of the inputs a stored build step was made from"""
+    __tablename__ = 'DataFingerprint'
+
+    name = db.Column(db.String(64), primary_key=True)
+    checksum = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DataFingerprint {self.name}: {self.checksum}>'
+
+
+# DataFingerprint of the whole database content, see app.get_data_checksum
+CONTENT_FINGERPRINT = 'content'
+
+
+def get_fingerprint(name):
+    fingerprint = db.session.get(DataFingerprint, name)
+    return fingerprint.checksum if fingerprint else None
+
+
+def set_fingerprint(name, checksum):
+    db.session.merge(DataFingerprint(name=name, checksum=checksum))
+    db.session.commit()
+
+
+class SeasonAlias(db.Model):
+    """Season name used by the match source (Raketo) mapped to our season.
+    Season id is not a foreign key: aliases are kept while content is reset and reloaded.
+    """
+    __tablename__ = 'SeasonAlias'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    alias = db.Column(db.String(255), nullable=False, unique=True, index=True)
+    season_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<SeasonAlias {self.alias} -> {self.season_id}>'
 
 
 class Match(db.Model):
@@ -399,6 +482,9 @@ class Match(db.Model):
     royal_tiebreak_player1 = db.Column(db.Integer, nullable=True)
     royal_tiebreak_player2 = db.Column(db.Integer, nullable=True)
 
+    # Natural key of the imported CSV row, see match_content_hash
+    content_hash = db.Column(db.String(40), nullable=True, index=True)
+
     # Relationships
     season = db.relationship('Season', backref='matches')
     division = db.relationship('Division', backref='matches')
@@ -500,86 +586,164 @@ def get_last_result_before_date(player_id, target_date, filter_seasons, expire_d
     return r.order_by(Season.date_end.desc(), Division.priority).first()
 
 
-def parse_score(score_string):
+# Match score columns in the order of parse_score_columns tuples (winner is player1)
+SCORE_COLUMNS = ('set1_player1', 'set1_player2', 'set2_player1', 'set2_player2', 'set3_player1', 'set3_player2',
+                 'tb1_player1', 'tb1_player2', 'tb2_player1', 'tb2_player2', 'tb3_player1', 'tb3_player2',
+                 'royal_tiebreak_player1', 'royal_tiebreak_player2')
+
+_SET_PATTERN = r'(\d+)-(\d+)(?: ?\((\d+)/(\d+)\))?'
+SCORE_PATTERN = re.compile(
+    rf'{_SET_PATTERN}(?: {_SET_PATTERN})?(?: {_SET_PATTERN})?(?: \[(\d+)[/-](\d+)\])?')
+
+
+class ScoreParseError(ValueError):
+    """Score string does not match SCORE_PATTERN"""
+
+    def __init__(self, score_string, row=None):
+        self.score_string = score_string
+        self.row = row
+        super().__init__(score_string, row)
+
+    def __str__(self):
+        message = f"Could not parse score: {self.score_string}"
+        return message if self.row is None else f"row {self.row}: {message}"
+
+
+@lru_cache(maxsize=4096)
+def _parse_score_columns(score_string):
+    match = SCORE_PATTERN.fullmatch(score_string)
+    if not match:
+        raise ScoreParseError(score_string)
+
+    groups = [int(g) if g is not None else None for g in match.groups()]
+    sets, royal_tiebreak = groups[:12], groups[12:]
+    if royal_tiebreak[0] is not None:
+        # 3rd set is not stored if royal tiebreak was played instead
+        sets[8:12] = [None] * 4
+    # regex groups go set by set (games, tiebreak), columns go games first
+    return tuple(sets[0:2] + sets[4:6] + sets[8:10] + sets[2:4] + sets[6:8] + sets[10:12] + royal_tiebreak)
+
+
+def parse_score_columns(score_string, row=None):
     """
-    Parse tennis score string into structured format
-    Supports formats: "6-3 6-3", "3-6 6-4 [10/8]", "4-6 6-3 [10/4]"
+    Parse tennis score string into Match score column values.
+    Supports formats: "6-3 6-3", "3-6 6-4 [10/8]", "7-6 (7/4) 6-7 (5/7) [10/4]", "9-8 (7/2)"
+    :param score_string: score of the winner first
+    :param row: row number reported if the score is malformed
+    :return: tuple of values in SCORE_COLUMNS order
+    :raises ScoreParseError: score does not match the score grammar
     """
-    if not score_string:
-        return None
+    try:
+        return _parse_score_columns(' '.join(score_string.split()))
+    except ScoreParseError:
+        raise ScoreParseError(score_string, row=row) from None
 
-    # Remove any extra spaces and split by space
-    parts = score_string.strip().split()
-
-    sets = []
-    royal_tiebreak = False
-    royal_tiebreak_score = None
-
-    for i, part in enumerate(parts):
-        if part.startswith('[') and part.endswith(']'):
-            # This is a tiebreak or royal tiebreak
-            tiebreak_content = part[1:-1]
-            if '/' in tiebreak_content:
-                # Format: [10/8] or [10/4]
-                royal_tiebreak = True
-                royal_score_parts = tiebreak_content.split('/')
-                royal_tiebreak_score = (int(royal_score_parts[0]), int(royal_score_parts[1]))
-
-        elif part.startswith('(') and part.endswith(')'):
-            # This is a regular tiebreak , must be after regular set
-            tiebreak_content = part[1:-1]
-            score_parts = tiebreak_content.split('/')
-            # The previous set should be a tiebreak
-            if sets:
-                sets[-1]['tiebreak'] = True
-                sets[-1]['tiebreak_score'] = {
-                    'player1': int(score_parts[0]),
-                    'player2': int(score_parts[1])
-                }
-
-
-        elif '-' in part:
-            # Regular set score
-            set_parts = part.split('-')
-            if len(set_parts) == 2 and set_parts[0].isdigit() and set_parts[1].isdigit():
-                sets.append({
-                    'player1': int(set_parts[0]),  # Winner's games
-                    'player2': int(set_parts[1]),  # Loser's games
-                    'tiebreak': False
-                })
 
-    return {
-        'sets': sets,
-        'royal_tiebreak': royal_tiebreak,
-        'royal_tiebreak_score': royal_tiebreak_score
-    }
+def parse_scores(score_strings, start=0):
+    """
+    Parse a batch of score strings, see parse_score_columns.
+    :param score_strings: iterable of score strings
+    :param start: row number of the first score, used in errors
+    :return: list of tuples in SCORE_COLUMNS order
+    """
+    return [parse_score_columns(score, row=i) for i, score in enumerate(score_strings, start)]
+
+def match_content_hash(winner_name, loser_name, season_name, date_str, score, occurrence=0):
+    """
+    Stable key of an imported match row: players, season, date and score.
+    :param score: score with normalized whitespace
+    :param occurrence: number of identical rows seen before in the same file
+    :return: hex sha1 digest
+    """
+    key = '\x1f'.join([winner_name, loser_name, season_name, date_str, score, str(occurrence)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+# Aliases stored on first use of an empty SeasonAlias table
+DEFAULT_SEASON_ALIASES = {'Amazing Masters Slam': 10,
+                          'Amazing Masters Slam 2': 10,
+                          'Amazing Masters Slam 3': 10,
+                          'Amazing Open Slam': 10,
+                          'Masters League Preseason 2025': 5,
+                          "Women's League Preseason 2025": 5,
+                          'Masters League Season 1/2025': 6,
+                          'Masters League Season 2/2025': 7,
+                          'Masters League Season 3/2025': 8,
+                          'Masters League Season 4/2025': 9,
+                          'Open League Preseason 2025': 5,
+                          'Open League Season 1/2025': 6,
+                          'Tashkent Masters League': 1,
+                          'Tashkent Masters League. Season 2': 2,
+                          'Tashkent Masters League. Season 3': 3,
+                          'Tashkent Masters League. Season 4': 4,
+                          'Tashkent Open League': 3,
+                          'Tashkent Open League. Season 2': 4,
+                          "Women's League Season 1/2025": 11,
+                          'Oltin Garros': 12,
+                          'Chilladon. The Championship': 13,
+                          'Chilladon': 13}
+
+
+# process-level aliases and the data version they were read at
+_season_aliases = {}
+
+
+def seed_season_aliases():
+    """Store DEFAULT_SEASON_ALIASES if SeasonAlias table is empty"""
+    if db.session.query(SeasonAlias.id).first() is None:
+        db.session.add_all(SeasonAlias(alias=alias, season_id=season_id)
+                           for alias, season_id in DEFAULT_SEASON_ALIASES.items())
+        db.session.commit()
+
+
+def load_season_aliases():
+    """
+    Alias -> season id lookup read from SeasonAlias in one query.
+    An empty table is filled with DEFAULT_SEASON_ALIASES.
+    :return: dict alias -> season id
+    """
+    seed_season_aliases()
+    return {alias: season_id for alias, season_id in db.session.query(SeasonAlias.alias, SeasonAlias.season_id)}
+
+
+def get_season_aliases():
+    """
+    Process-level alias -> season id lookup, read again after the data version changed,
+    so aliases added by another process (manage.py add-season-alias) are seen.
+    :return: dict alias -> season id
+    """
+    version = get_data_version()
+    if _season_aliases.get('version') != version:
+        _season_aliases.update(aliases=load_season_aliases(), version=version)
+    return _season_aliases['aliases']
+
+
+def invalidate_season_aliases():
+    _season_aliases.clear()
+
+
+def set_season_alias(alias, season_id):
+    """
+    Register or remap a season alias.
+    :param alias: season name used by the match source
+    :param season_id: Season id
+    :return: SeasonAlias
+    """
+    seed_season_aliases()  # default aliases are stored before the first custom one
+    season_alias = SeasonAlias.query.filter_by(alias=alias).first()
+    if season_alias is None:
+        season_alias = SeasonAlias(alias=alias)
+        db.session.add(season_alias)
+    season_alias.season_id = season_id
+    db.session.commit()
+    invalidate_season_aliases()
+    return season_alias
 
 
 def get_season_by_raketo_name(season_name):
-    raketo_names = {'Amazing Masters Slam': 10,
-                  'Amazing Masters Slam 2': 10,
-                  'Amazing Masters Slam 3': 10,
-                  'Amazing Open Slam': 10,
-                  'Masters League Preseason 2025': 5,
-                  "Women's League Preseason 2025": 5,
-                  'Masters League Season 1/2025': 6,
-                  'Masters League Season 2/2025': 7,
-                  'Masters League Season 3/2025': 8,
-                  'Masters League Season 4/2025': 9,
-                  'Open League Preseason 2025': 5,
-                  'Open League Season 1/2025': 6,
-                  'Tashkent Masters League': 1,
-                  'Tashkent Masters League. Season 2': 2,
-                  'Tashkent Masters League. Season 3': 3,
-                  'Tashkent Masters League. Season 4': 4,
-                  'Tashkent Open League': 3,
-                  'Tashkent Open League. Season 2': 4,
-                  "Women's League Season 1/2025": 11,
-                  'Oltin Garros': 12,
-                  'Chilladon. The Championship': 13,
-                  'Chilladon': 13}
-    if season_name in raketo_names:
-        return Season.query.get(raketo_names[season_name])
+    season_id = get_season_aliases().get(season_name)
+    if season_id is not None:
+        return db.session.get(Season, season_id)
 
 
 def get_common_divisions_in_season(player1_id, player2_id, season_id):
@@ -648,6 +812,53 @@ def get_lowest_division_in_season(player1_id, player2_id, season_id):
         return max_d
 
 
+def load_season_divisions():
+    """
+    Index divisions by the season and the players who have results in them.
+    One query instead of the per-match lookups of get_common_divisions_in_season.
+    :return: dict (season_id, player_id) -> list of (division_id, priority) ordered by division id
+    """
+    rows = db.session.query(Division.season_id, Result.player_id, Division.id, Division.priority) \
+        .join(Result, Division.id == Result.division_id) \
+        .distinct() \
+        .order_by(Division.id) \
+        .all()
+
+    season_divisions = {}
+    for season_id, player_id, division_id, priority in rows:
+        season_divisions.setdefault((season_id, player_id), []).append((division_id, priority))
+    return season_divisions
+
+
+def select_match_division(season_divisions, player1_id, player2_id, season_id):
+    """
+    In-memory equivalent of get_common_divisions_in_season with the
+    get_lowest_division_in_season fallback used by the match import.
+    :param season_divisions: index built by load_season_divisions
+    :return: division id or None
+    """
+    player1_divisions = season_divisions.get((season_id, player1_id))
+    player2_divisions = season_divisions.get((season_id, player2_id))
+    if not player1_divisions or not player2_divisions:
+        return None
+
+    player2_ids = {division_id for division_id, _ in player2_divisions}
+    common = [d for d in player1_divisions if d[0] in player2_ids]
+    if common:
+        # select max priority division if there were several common ones
+        division_id, max_priority = common[0]
+        for d_id, priority in common:
+            if max_priority < priority:
+                division_id, max_priority = d_id, priority
+        return division_id
+
+    division_id = None
+    max_priority = 0
+    for d_id, priority in player1_divisions:
+        if priority > max_priority:
+            division_id, max_priority = d_id, priority
+    return division_id
+
 def get_player_match_history(player_id, limit=10):
     """Get player's match history with opponent details"""
     matches = Match.query.filter(
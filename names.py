@@ -0,0 +1,296 @@
+"""
+Player name resolution for imports and the application list, and the player search index.
+Names are reduced to normalized keys (transliterated, lower case, spelling variants folded),
+every player is indexed as "Last First" and "First Last", and near misses are found with a BK-tree
+over the keys, which prunes candidates by the triangle inequality instead of comparing every player.
+The search index maps n-grams of the normalized name words to players, so autocomplete
+finds substrings in either alphabet without scanning players or querying the database.
+"""
+import re
+import unicodedata
+import threading
+from collections import OrderedDict, defaultdict
+from itertools import permutations
+
+from flask import current_app
+
+from cache import get_data_version
+from extensions import db
+from models import Player
+from ranking_snapshot import get_ranking_snapshot, load_current_rankings
+
+
+def transliterate(text):
+    # Russian transliteration mapping (ISO 9 standard)
+    translit_dict = {
+        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+        'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+        'ъ': '', 'ы': 'y', 'ь': "'", 'э': 'e', 'ю': 'yu', 'я': 'ya',
+        'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'Yo',
+        'Ж': 'Zh', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
+        'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
+        'Ф': 'F', 'Х': 'Kh', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Щ': 'Sch',
+        'Ъ': '', 'Ы': 'Y', 'Ь': "'", 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya'
+    }
+
+    result = []
+    for char in text:
+        result.append(translit_dict.get(char, char))
+    return ''.join(result)
+
+
+# latin spellings of the same sound, e.g. Khaleulin / Xaleulin, Tadzhiev / Tadjiev, Fyodor / Fedor, Yuriy / Iurii
+_LATIN_FOLDS = (('kh', 'x'), ('dzh', 'j'), ('dj', 'j'), ('sch', 'sh'), ('yo', 'e'), ('yu', 'iu'), ('ya', 'ia'), ('y', 'i'))
+
+
+def normalize_name(name):
+    """
+    Key of a player name that does not depend on alphabet, case, accents, punctuation or doubled letters.
+    """
+    text = transliterate(unicodedata.normalize('NFKC', name).lower())
+    text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+    # soft sign and Uzbek o' / g' are written with any kind of apostrophe or without
+    text = re.sub(r"['`\u2019\u02bb\u02bc]", '', text)
+    for variant, folded in _LATIN_FOLDS:
+        text = text.replace(variant, folded)
+    tokens = [re.sub(r'([a-z])\1+', r'\1', token) for token in re.findall(r'[a-z0-9]+', text)]
+    return ' '.join(tokens)
+
+
+def levenshtein(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """Metric tree of strings for edit distance lookups"""
+
+    def __init__(self, distance=levenshtein):
+        self.distance = distance
+        self.root = None
+
+    def add(self, key):
+        if self.root is None:
+            self.root = (key, {})
+            return
+        node = self.root
+        while True:
+            d = self.distance(key, node[0])
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = (key, {})
+                return
+            node = child
+
+    def search(self, key, max_distance):
+        """:return: list of (distance, key) within max_distance of key"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_key, children = stack.pop()
+            d = self.distance(key, node_key)
+            if d <= max_distance:
+                found.append((d, node_key))
+            for child_distance, child in children.items():
+                if d - max_distance <= child_distance <= d + max_distance:
+                    stack.append(child)
+        return found
+
+
+def default_max_distance(key):
+    """Edits allowed for a near miss: one per 8 characters of the name, at least one"""
+    return max(1, len(key) // 8)
+
+
+class PlayerNameIndex:
+    """Resolves written player names to player ids"""
+
+    def __init__(self, players):
+        """
+        :param players: iterable of (player id, first name, last name)
+        """
+        self.player_ids = defaultdict(list)
+        self.tree = BKTree()
+        # the application list resolves the same names on every request
+        self._resolved = {}
+        for player_id, first_name, last_name in players:
+            for name in (f'{last_name} {first_name}', f'{first_name} {last_name}'):
+                key = normalize_name(name)
+                if key and player_id not in self.player_ids[key]:
+                    self.player_ids[key].append(player_id)
+                    self.tree.add(key)
+
+    def candidates(self, name, max_distance=None, limit=5):
+        """
+        Players whose normalized name is within max_distance edits of name.
+        :param max_distance: default_max_distance of the key if None
+        :return: list of (player id, distance), closest first
+        """
+        key = normalize_name(name)
+        if not key:
+            return []
+        if max_distance is None:
+            max_distance = default_max_distance(key)
+        distances = {}
+        for d, k in self.tree.search(key, max_distance):
+            for player_id in self.player_ids[k]:
+                distances[player_id] = min(d, distances.get(player_id, d))
+        return sorted(distances.items(), key=lambda item: (item[1], item[0]))[:limit]
+
+    def resolve(self, name, max_distance=None):
+        """
+        :return: id of the only closest player, None if nobody is close enough or the closest are tied
+        """
+        if (name, max_distance) not in self._resolved:
+            candidates = self.candidates(name, max_distance, limit=2)
+            if not candidates or (len(candidates) > 1 and candidates[1][1] == candidates[0][1]):
+                player_id = None
+            else:
+                player_id = candidates[0][0]
+            self._resolved[(name, max_distance)] = player_id
+        return self._resolved[(name, max_distance)]
+
+
+def load_player_name_index():
+    return PlayerNameIndex(db.session.query(Player.id, Player.first_name, Player.last_name))
+
+
+# process-level index and the data version it was built from
+_player_name_index = {}
+
+
+def get_player_name_index():
+    """Name index of the current players, rebuilt after the data was changed by this or any other process"""
+    version = get_data_version()
+    if _player_name_index.get('version') != version:
+        _player_name_index.update(index=load_player_name_index(), version=version)
+    return _player_name_index['index']
+
+
+def invalidate_player_name_index():
+    _player_name_index.clear()
+
+
+# longest n-gram indexed, longer query words are looked up by their n-grams and then checked
+SEARCH_NGRAM = 3
+
+
+class PlayerSearchIndex:
+    """Substring search over player names for autocomplete"""
+
+    def __init__(self, players, cache_size=1024):
+        """
+        :param players: iterable of dicts with id, first_name, last_name and position (None if not ranked)
+        :param cache_size: results of this many recent queries are kept, typing repeats prefixes a lot
+        """
+        self.players = []
+        self.words = []
+        self.postings = defaultdict(set)
+        self.cache_size = cache_size
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        for player in players:
+            i = len(self.players)
+            words = normalize_name(f"{player['first_name']} {player['last_name']}").split()
+            self.players.append(player)
+            self.words.append(words)
+            for word in words:
+                for n in range(1, SEARCH_NGRAM + 1):
+                    for start in range(len(word) - n + 1):
+                        self.postings[word[start:start + n]].add(i)
+
+    def _lookup(self, word):
+        """Indexes of players with a name word containing word"""
+        n = min(len(word), SEARCH_NGRAM)
+        grams = sorted((word[start:start + n] for start in range(len(word) - n + 1)),
+                       key=lambda gram: len(self.postings.get(gram, ())))
+        found = set(self.postings.get(grams[0], ()))
+        for gram in grams[1:]:
+            found &= self.postings.get(gram, set())
+            if not found:
+                break
+        if len(word) > SEARCH_NGRAM:
+            found = {i for i in found if any(word in w for w in self.words[i])}
+        return found
+
+    def search(self, query, limit=10, cached_only=False):
+        """
+        Players with a different name word containing each word of the query, in any alphabet and order.
+        Players with a name word starting with every query word come first, then by ranking position.
+        Results are cached per normalized query, the index is rebuilt (and the cache dropped) on data changes.
+        :param cached_only: return None instead of searching if the query is not cached
+        :return: list of player dicts
+        """
+        key = (normalize_name(query), limit)
+        with self._lock:
+            results = self._results.get(key)
+            if results is not None:
+                self._results.move_to_end(key)
+                return results
+        if cached_only:
+            return None
+
+        results = self._search(key[0].split(), limit)
+        with self._lock:
+            self._results[key] = results
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return results
+
+    def _search(self, query_words, limit):
+        if not query_words:
+            return []
+        found = None
+        for word in sorted(query_words, key=len, reverse=True):
+            matches = self._lookup(word)
+            found = matches if found is None else found & matches
+            if not found:
+                return []
+        if len(query_words) > 1:
+            # "al sh" finds Alisher Sharopov, not Alisher alone
+            found = {i for i in found if any(all(q in w for q, w in zip(query_words, words))
+                                             for words in permutations(self.words[i], len(query_words)))}
+
+        def order(i):
+            player = self.players[i]
+            prefix = all(any(w.startswith(word) for w in self.words[i]) for word in query_words)
+            return (not prefix, player['position'] is None, player['position'] or 0,
+                    player['last_name'], player['first_name'])
+
+        return [self.players[i] for i in sorted(found, key=order)[:limit]]
+
+
+def load_player_search_index(snapshot=None, cache_size=1024):
+    """Search index of the players in the ranking snapshot, read from the database without a snapshot"""
+    if snapshot is not None:
+        return PlayerSearchIndex(snapshot.players(), cache_size)
+    current = load_current_rankings()
+    return PlayerSearchIndex(({'id': p.id, 'first_name': p.first_name, 'last_name': p.last_name,
+                               'position': current.get(p.id, (None, None))[0]} for p in Player.query.order_by(Player.id)),
+                             cache_size)
+
+
+# process-level index and the data it was built from
+_player_search_index = {}
+
+
+def get_player_search_index():
+    """Search index of the current data, rebuilt after the data version or the ranking snapshot changed"""
+    snapshot = get_ranking_snapshot()
+    # the snapshot object is replaced whenever its file was published again
+    version = (get_data_version(), snapshot)
+    if _player_search_index.get('version') != version:
+        index = load_player_search_index(snapshot, current_app.config.get('SEARCH_CACHE_SIZE', 1024))
+        _player_search_index.update(index=index, version=version)
+    return _player_search_index['index']
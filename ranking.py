@@ -0,0 +1,668 @@
+"""
+Ranking engine.
+
+All ranked results are fetched once (joined with their division and season)
+and every ranking snapshot is then computed in memory, so rebuilding rankings
+costs one query per rebuild instead of several queries per player and date.
+"""
+import hashlib
+from bisect import bisect_right
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+
+from cache import get_data_version
+from extensions import db
+from models import Player, Result, Division, Season, Ranking, RankingDelta, DataFingerprint, calc_new_priority, \
+    ranking_to_dict
+
+ResultRow = namedtuple('ResultRow', ['id', 'player_id', 'position', 'relegation', 'priority',
+                                     'season_id', 'date_end', 'league_id', 'gender', 'is_ranked'])
+
+LastRanking = namedtuple('LastRanking', ['actual_date', 'position', 'career_high', 'actual_season_id',
+                                         'last_result_id'])
+
+# partition with all players, the only one before rankings were split by league and gender
+ALL_PARTITION = 'all'
+
+# DataFingerprint names of season_checksums stored with the ranking snapshots
+SEASON_FINGERPRINT_PREFIX = 'rankings:season:'
+
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def load_result_rows(filter_seasons='ranked'):
+    """
+    Fetch all results needed for rankings in a single query.
+    Rows are ordered by (date_end, priority, id), which the in-memory pass relies on.
+    """
+    query = db.session.query(Result.id, Result.player_id, Result.position, Result.relegation,
+                             Division.priority, Division.season_id, Season.date_end,
+                             Season.league_id, Player.gender, Season.is_ranked) \
+        .join(Division, Result.division_id == Division.id) \
+        .join(Season, Division.season_id == Season.id) \
+        .join(Player, Result.player_id == Player.id) \
+        .filter(Result.player_id.isnot(None), Season.date_end.isnot(None))
+
+    if filter_seasons == 'ranked':
+        query = query.filter(Season.is_ranked == True)
+
+    query = query.order_by(Season.date_end, Division.priority, Result.id)
+
+    return [ResultRow(*row) for row in query.all()]
+
+
+def get_last_results(rows, date, expire_days=None):
+    """
+    Latest result per player before date, the in-memory equivalent of get_last_result_before_date.
+    :return: dict player_id -> ResultRow
+    """
+    date = to_date(date)
+    cutoff_date = date - timedelta(days=expire_days) if expire_days else None
+
+    last_results = {}
+    for row in rows:
+        if row.date_end > date:
+            break  # rows are sorted by date_end
+        if cutoff_date and row.date_end < cutoff_date:
+            continue
+
+        # for the same date_end the first row has the lowest priority, i.e. the highest division
+        best = last_results.get(row.player_id)
+        if best is None or row.date_end > best.date_end:
+            last_results[row.player_id] = row
+
+    return last_results
+
+
+class RankingRules:
+    """
+    Named set of ranking regulations.
+
+    :param expire_days: results older than this are not ranked (None - never expire)
+    :param filter_seasons: 'ranked' to use results of ranked seasons only, 'all' for every season
+    :param step: priority change for promotion and relegation
+    :param double_step: priority change for double promotion
+    :param jumps: priority after promotion -> priority the player moves to, see models.PROMOTION_JUMPS
+    :param sort_order: ranking sort criteria, in order of importance; any of SORT_CRITERIA
+    """
+    SORT_CRITERIA = ('new_priority', 'prev_priority', 'position', 'recency')
+
+    def __init__(self, name, description='', expire_days=365, filter_seasons='ranked', step=10, double_step=20,
+                 jumps=None, sort_order=SORT_CRITERIA):
+        unknown = set(sort_order) - set(self.SORT_CRITERIA)
+        if unknown:
+            raise ValueError(f'Unknown sort criteria: {", ".join(sorted(unknown))}')
+
+        self.name = name
+        self.description = description
+        self.expire_days = expire_days
+        self.filter_seasons = filter_seasons
+        self.step = step
+        self.double_step = double_step
+        self.jumps = jumps
+        self.sort_order = tuple(sort_order)
+
+    def __repr__(self):
+        return f'<RankingRules {self.name}>'
+
+    def new_priority(self, prev_priority, relegation):
+        return calc_new_priority(prev_priority, relegation, self.step, self.double_step, self.jumps)
+
+    def sort_key(self, row):
+        key = []
+        for name in self.sort_order:
+            if name == 'new_priority':
+                key.append(self.new_priority(row.priority, row.relegation))  # (ascending)
+            elif name == 'prev_priority':
+                key.append(row.priority)  # (ascending)
+            elif name == 'position':
+                key.append(row.position)  # (ascending)
+            else:
+                key.append(-(row.date_end.toordinal()))  # recency (descending)
+        key.append(row.player_id)
+        return tuple(key)
+
+    def select_rows(self, rows):
+        """Result rows these rules rank, rows may be loaded with load_result_rows(filter_seasons='all')"""
+        if self.filter_seasons == 'ranked':
+            return [row for row in rows if row.is_ranked]
+        return rows
+
+    def rank(self, rows, date):
+        """Ranking for date, see rank_players"""
+        return rank_players(self.select_rows(rows), date, self.expire_days, self.sort_key)
+
+
+# regulations in force
+DEFAULT_RULES = RankingRules('current', 'Current league regulations')
+
+RANKING_RULES = {rules.name: rules for rules in (
+    DEFAULT_RULES,
+    RankingRules('half-year-expiry', 'Results expire after half a year', expire_days=182),
+    RankingRules('all-seasons', 'Unranked seasons count too', filter_seasons='all'),
+    RankingRules('position-first', 'Final position matters more than the previous division',
+                 sort_order=('new_priority', 'position', 'prev_priority', 'recency')),
+    RankingRules('no-semipro-jump', 'M1 winners are promoted to priority 100 instead of SemiPro',
+                 jumps={200: 150}),
+)}
+
+
+def get_ranking_rules(name=None):
+    """Rule set by name, the one configured by RANKING_RULES by default"""
+    if name is None:
+        name = current_app.config.get('RANKING_RULES', DEFAULT_RULES.name)
+    if name not in RANKING_RULES:
+        raise ValueError(f'Unknown ranking rules: {name}')
+    return RANKING_RULES[name]
+
+
+def ranking_sort_key(row):
+    return DEFAULT_RULES.sort_key(row)
+
+
+def rank_players(rows, date, expire_days=365, sort_key=ranking_sort_key):
+    """
+    Calculate ranking for given date from preloaded result rows.
+    :return: list of ResultRow, ordered by ranking position
+    """
+    last_results = get_last_results(rows, date, expire_days)
+    return sorted(last_results.values(), key=sort_key)
+
+
+def get_ranking_partitions(rows):
+    """
+    Partitions rankings are calculated for: all players, every gender and, if there
+    are several leagues, every league. Keys look like 'all', 'gender:female', 'league:2'.
+    """
+    partitions = [ALL_PARTITION]
+    partitions.extend(f'gender:{gender}' for gender in sorted(set(row.gender for row in rows if row.gender)))
+
+    leagues = sorted(set(row.league_id for row in rows))
+    if len(leagues) > 1:
+        partitions.extend(f'league:{league_id}' for league_id in leagues)
+
+    return partitions
+
+
+def partition_rows(rows, partition):
+    """Result rows of players ranked in given partition"""
+    if partition == ALL_PARTITION:
+        return rows
+
+    kind, _, value = partition.partition(':')
+    if kind == 'gender':
+        return [row for row in rows if row.gender == value]
+    if kind == 'league':
+        return [row for row in rows if str(row.league_id) == value]
+
+    raise ValueError(f'Unknown ranking partition: {partition}')
+
+
+# result rows shared with pool workers, set once per worker by _init_worker
+_worker_rows = None
+_worker_partitions = {}
+
+
+def _init_worker(rows):
+    global _worker_rows
+    _worker_rows = rows
+    _worker_partitions.clear()
+
+
+def _rank_players_in_worker(partition, date, rules):
+    if partition not in _worker_partitions:
+        _worker_partitions[partition] = partition_rows(_worker_rows, partition)
+    return rules.rank(_worker_partitions[partition], date)
+
+
+def compute_partitioned_snapshots(rows, dates, partitions, jobs=1, rules=DEFAULT_RULES):
+    """
+    Calculate ranking snapshots for several partitions and dates.
+
+    Snapshots only depend on the read-only result rows, so with jobs > 1 every
+    (partition, date) pair is computed in a process pool; every worker receives
+    the rows once on start.
+    :return: dict partition -> dict date -> list of ResultRow ordered by ranking position
+    """
+    tasks = [(partition, date) for partition in partitions for date in dates]
+
+    if jobs <= 1 or len(tasks) <= 1:
+        snapshots = {}
+        for partition in partitions:
+            selected = partition_rows(rows, partition)
+            snapshots[partition] = {date: rules.rank(selected, date) for date in dates}
+        return snapshots
+
+    snapshots = {partition: {} for partition in partitions}
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)),
+                             initializer=_init_worker, initargs=(rows,)) as pool:
+        ranked = pool.map(_rank_players_in_worker,
+                          [task[0] for task in tasks], [task[1] for task in tasks], [rules] * len(tasks))
+        for (partition, date), snapshot in zip(tasks, ranked):
+            snapshots[partition][date] = snapshot
+
+    return snapshots
+
+
+def compute_snapshots(rows, dates, jobs=1, rules=DEFAULT_RULES):
+    """
+    Calculate ranking snapshots of all players for several dates, see compute_partitioned_snapshots.
+    :return: dict date -> list of ResultRow ordered by ranking position
+    """
+    return compute_partitioned_snapshots(rows, dates, [ALL_PARTITION], jobs, rules)[ALL_PARTITION]
+
+
+def get_ranking_dates(since=None):
+    """Dates of ranking snapshots: end dates of completed ranked seasons"""
+    query = db.session.query(Season.date_end).distinct() \
+        .filter(Season.is_ranked == True, Season.is_completed == True, Season.date_end.isnot(None))
+    if since:
+        query = query.filter(Season.date_end >= since)
+
+    return sorted(d for (d,) in query.all())
+
+
+def get_stored_ranking_dates(partition=ALL_PARTITION):
+    """Dates of ranking snapshots present in the configured ranking storage"""
+    model = RankingDelta if current_app.config.get('RANKING_STORAGE') == 'delta' else Ranking
+    query = db.session.query(model.actual_date).distinct().filter(model.partition == partition)
+
+    return sorted(d for (d,) in query.all())
+
+
+def get_stored_partitions():
+    """Partitions present in the Ranking table"""
+    return [p for (p,) in db.session.query(Ranking.partition).distinct().order_by(Ranking.partition)]
+
+
+def season_checksums(rows):
+    """
+    Checksum of the ranking input of every season: its result rows as returned by load_result_rows.
+    :return: dict season_id -> hex digest
+    """
+    checksums = {}
+    for row in rows:
+        checksums.setdefault(row.season_id, hashlib.sha256()).update(repr(tuple(row)).encode())
+    return {season_id: checksum.hexdigest() for season_id, checksum in checksums.items()}
+
+
+def get_stored_season_checksums():
+    """:return: dict season_id -> checksum stored with the current ranking snapshots"""
+    query = db.session.query(DataFingerprint.name, DataFingerprint.checksum) \
+        .filter(DataFingerprint.name.startswith(SEASON_FINGERPRINT_PREFIX))
+    return {int(name[len(SEASON_FINGERPRINT_PREFIX):]): checksum for name, checksum in query}
+
+
+def get_earliest_affected_date(season_ids=None, rows=None):
+    """
+    Earliest ranking snapshot date that may change.
+
+    A result can only affect snapshots dated on or after its season end. Seasons whose results
+    changed since the snapshots were stored are found by comparing season_checksums with the
+    checksums stored along with them; without stored checksums every season counts as changed.
+    Ranked dates without a snapshot and snapshot dates that are no longer a ranked season end
+    (of the 'all' partition, others share its dates) are affected too.
+    :param season_ids: ids of seasons known to be changed, their dates are affected in any case
+    :param rows: result rows loaded with the configured rules, loaded if omitted
+    :return: date or None if nothing has to be recalculated
+    """
+    if rows is None:
+        rows = load_result_rows(filter_seasons=get_ranking_rules().filter_seasons)
+
+    stored_dates = set(get_stored_ranking_dates())
+    affected = set(get_ranking_dates()).symmetric_difference(stored_dates)
+
+    current, stored = season_checksums(rows), get_stored_season_checksums()
+    changed = {season_id for season_id in current.keys() | stored.keys()
+               if current.get(season_id) != stored.get(season_id)}
+    changed.update(season_ids or ())
+    if changed:
+        date_ends = dict(db.session.query(Season.id, Season.date_end).filter(Season.id.in_(changed)))
+        for season_id in changed:
+            if season_id not in date_ends:
+                # season deleted: the snapshots it was part of are not known
+                affected.update(stored_dates)
+            elif date_ends[season_id] is not None:
+                affected.add(to_date(date_ends[season_id]))
+
+    if not affected:
+        return None
+    return min(affected)
+
+
+def snapshot_mappings(date, ranked, career_highs=None, partition=ALL_PARTITION):
+    """
+    Ranking rows (as dicts for bulk insert) for a snapshot returned by rank_players.
+
+    :param career_highs: dict player_id -> best position in earlier snapshots, updated in place;
+        call with snapshots in date order to keep running career highs
+    """
+    if career_highs is None:
+        career_highs = {}
+
+    mappings = []
+    for i, row in enumerate(ranked):
+        position = i + 1
+        career_high = min(position, career_highs.get(row.player_id, position))
+        career_highs[row.player_id] = career_high
+
+        mappings.append({'partition': partition,
+                         'player_id': row.player_id,
+                         'position': position,
+                         'career_high': career_high,
+                         'actual_date': date,
+                         'actual_season_id': row.season_id,
+                         'last_result_id': row.id})
+    return mappings
+
+
+def load_career_highs(before, partition=ALL_PARTITION):
+    """
+    Best position of every player in stored snapshots dated before given date.
+    :return: dict player_id -> position
+    """
+    if current_app.config.get('RANKING_STORAGE') == 'delta':
+        career_highs = {}
+        load_ranking_state(before, before=True, career_highs=career_highs, partition=partition)
+        return career_highs
+
+    query = db.session.query(Ranking.player_id, func.min(Ranking.position)) \
+        .filter(Ranking.partition == partition, Ranking.actual_date < before) \
+        .group_by(Ranking.player_id)
+    return dict(query.all())
+
+
+def load_last_rankings(partition=ALL_PARTITION, player_id=None):
+    """
+    Latest stored snapshot every player was ranked in, also for players whose results expired since.
+    With RANKING_STORAGE = 'delta' Ranking only holds the current snapshot, so they are replayed from RankingDelta.
+    :param player_id: only load this player
+    :return: dict player_id -> LastRanking
+    """
+    if current_app.config.get('RANKING_STORAGE') == 'delta':
+        career_highs, last_rankings = {}, {}
+        load_ranking_state(datetime.max.date(), career_highs=career_highs, partition=partition,
+                           last_rankings=last_rankings)
+        return {p_id: LastRanking(actual_date, position, career_highs[p_id], season_id, result_id)
+                for p_id, (actual_date, position, season_id, result_id) in last_rankings.items()
+                if player_id in (None, p_id)}
+
+    latest = db.session.query(Ranking.player_id, func.max(Ranking.actual_date).label('actual_date')) \
+        .filter(Ranking.partition == partition)
+    if player_id is not None:
+        latest = latest.filter(Ranking.player_id == player_id)
+    latest = latest.group_by(Ranking.player_id).subquery()
+
+    query = db.session.query(Ranking.player_id, Ranking.actual_date, Ranking.position, Ranking.career_high,
+                             Ranking.actual_season_id, Ranking.last_result_id) \
+        .join(latest, (Ranking.player_id == latest.c.player_id) & (Ranking.actual_date == latest.c.actual_date)) \
+        .filter(Ranking.partition == partition)
+    return {p_id: LastRanking(*ranking) for p_id, *ranking in query}
+
+
+def encode_ranking_deltas(snapshots, base=None, partition=ALL_PARTITION):
+    """
+    Encode snapshots as RankingDelta rows (dicts for bulk insert).
+
+    Only changes of the ranked results are stored: a player entering the ranking or ranked
+    by a newer result, or leaving it (last_result_id None). Positions follow from the ranked
+    results and are derived when the ranking is read, see load_ranking_state.
+    :param snapshots: dict date -> list of ResultRow ordered by position
+    :param base: ranking state before the first snapshot, see load_ranking_state
+    """
+    state = {player_id: result_id for player_id, (_, _, result_id) in (base or {}).items()}
+    deltas = []
+    for date in sorted(snapshots):
+        snapshot = snapshots[date]
+        changed = [row for row in snapshot if state.get(row.player_id) != row.id]
+        if not changed and snapshot:
+            # unchanged snapshot: repeat one row so that the snapshot date stays visible
+            changed = snapshot[:1]
+
+        for row in changed:
+            deltas.append({'partition': partition,
+                           'actual_date': date,
+                           'player_id': row.player_id,
+                           'actual_season_id': row.season_id,
+                           'last_result_id': row.id})
+        new_state = {row.player_id: row.id for row in snapshot}
+        for player_id in state.keys() - new_state.keys():
+            deltas.append({'partition': partition,
+                           'actual_date': date,
+                           'player_id': player_id,
+                           'actual_season_id': None,
+                           'last_result_id': None})
+        state = new_state
+
+    return deltas
+
+
+def load_ranking_state(date, before=False, career_highs=None, partition=ALL_PARTITION, last_rankings=None):
+    """
+    Replay ranking deltas up to date (inclusive, or exclusive with before=True).
+    Deltas are read with their results in one query, players are ordered by the ranking rules.
+
+    :param career_highs: optional dict filled with player_id -> best position while replaying
+    :param last_rankings: optional dict filled with player_id -> (date, position, season_id, last_result_id)
+        of the last replayed snapshot the player was ranked in
+    :return: (snapshot date or None, dict player_id -> (position, season_id, last_result_id))
+    """
+    query = db.session.query(RankingDelta.actual_date, RankingDelta.player_id, RankingDelta.actual_season_id,
+                             Result.id, Result.player_id, Result.position, Result.relegation,
+                             Division.priority, Division.season_id, Season.date_end,
+                             Season.league_id, Player.gender, Season.is_ranked) \
+        .outerjoin(Result, RankingDelta.last_result_id == Result.id) \
+        .outerjoin(Division, Result.division_id == Division.id) \
+        .outerjoin(Season, Division.season_id == Season.id) \
+        .outerjoin(Player, Result.player_id == Player.id) \
+        .filter(RankingDelta.partition == partition)
+    if before:
+        query = query.filter(RankingDelta.actual_date < date)
+    else:
+        query = query.filter(RankingDelta.actual_date <= date)
+
+    sort_key = get_ranking_rules().sort_key
+    snapshot_date = None
+    state = {}
+
+    def ranked():
+        return sorted(state.items(), key=lambda item: sort_key(item[1][1]))
+
+    def replay_snapshot():
+        for position, (player_id, (season_id, row)) in enumerate(ranked(), 1):
+            if career_highs is not None:
+                career_highs[player_id] = min(position, career_highs.get(player_id, position))
+            if last_rankings is not None:
+                last_rankings[player_id] = (snapshot_date, position, season_id, row.id)
+
+    track = career_highs is not None or last_rankings is not None
+    for actual_date, player_id, season_id, *result in \
+            query.order_by(RankingDelta.actual_date, RankingDelta.id):
+        if track and snapshot_date not in (None, actual_date):
+            replay_snapshot()
+        snapshot_date = actual_date
+        if result[0] is None:
+            state.pop(player_id, None)
+        else:
+            state[player_id] = (season_id, ResultRow(*result))
+    if track and snapshot_date is not None:
+        replay_snapshot()
+
+    return snapshot_date, {player_id: (position, season_id, row.id)
+                           for position, (player_id, (season_id, row)) in enumerate(ranked(), 1)}
+
+
+def get_delta_rankings(date, partition=ALL_PARTITION):
+    """Ranking table for date restored from RankingDelta, same rows as Ranking.to_dict()"""
+    career_highs = {}
+    snapshot_date, state = load_ranking_state(date, career_highs=career_highs, partition=partition)
+    if not state:
+        return []
+
+    return rankings_to_dicts(state.values(), snapshot_date, career_highs)
+
+
+def rankings_to_dicts(entries, actual_date, career_highs=None):
+    """
+    Ranking table rows for (position, season_id, last_result_id) entries, like Ranking.to_dict().
+    Referenced results are loaded in one query.
+    :param career_highs: dict player_id -> career high position
+    """
+    entries = sorted(entries)
+    results = Result.query \
+        .options(db.joinedload(Result.player_ref),
+                 db.joinedload(Result.division_ref).joinedload(Division.season_ref)) \
+        .filter(Result.id.in_([entry[2] for entry in entries]))
+    results = {r.id: r for r in results}
+
+    career_highs = career_highs or {}
+    return [ranking_to_dict(results[result_id], position, actual_date, season_id,
+                            career_high=career_highs.get(results[result_id].player_id))
+            for position, season_id, result_id in entries]
+
+
+def get_rankings_data(date, partition=ALL_PARTITION):
+    """Ranking table for date as list of dicts, read from the configured ranking storage"""
+    if current_app.config.get('RANKING_STORAGE') == 'delta':
+        return get_delta_rankings(date, partition)
+
+    rankings = Ranking.query.filter_by(partition=partition, actual_date=date).order_by('position').all()
+    return [r.to_dict() for r in rankings]
+
+
+class RankingIndex:
+    """
+    Rankings for any date, precomputed from ranked results.
+
+    Every result is the player's ranking result from its season end until it expires
+    (rules.expire_days later) or a newer result replaces it. The ranking therefore only changes
+    at season ends and expiry dates: the index sweeps these breakpoints once, keeps the
+    ranking valid from each of them and answers a date with a binary search.
+    """
+
+    def __init__(self, rows, rules=DEFAULT_RULES, snapshot_dates=None):
+        """
+        :param snapshot_dates: dates of stored ranking snapshots (see get_ranking_dates), career
+            highs are counted at these dates only; season ends of rows if omitted
+        """
+        rows = rules.select_rows(rows)
+        if snapshot_dates is None:
+            snapshot_dates = set(row.date_end for row in rows)
+        snapshot_dates = set(snapshot_dates)
+
+        events = {date: ([], []) for date in snapshot_dates}
+        for row in rows:
+            events.setdefault(row.date_end, ([], []))[1].append(row)
+            if rules.expire_days:
+                expire_date = row.date_end + timedelta(days=rules.expire_days + 1)
+                events.setdefault(expire_date, ([], []))[0].append(row)
+
+        self.dates = sorted(events)
+        self.rankings = []  # per breakpoint: tuple of ResultRow ordered by position
+        self.positions = []  # per breakpoint: dict player_id -> position
+        self.career_highs = []  # per breakpoint: dict player_id -> best position at earlier season ends
+
+        current = {}
+        career_highs = {}
+        for date in self.dates:
+            expired, started = events[date]
+            for row in expired:
+                if current.get(row.player_id) is row:
+                    del current[row.player_id]
+            # rows are sorted by (date_end, priority, id): the first one of a date wins
+            for row in started:
+                best = current.get(row.player_id)
+                if best is None or best.date_end < row.date_end:
+                    current[row.player_id] = row
+
+            ranked = tuple(sorted(current.values(), key=rules.sort_key))
+            positions = {row.player_id: i + 1 for i, row in enumerate(ranked)}
+            self.rankings.append(ranked)
+            self.positions.append(positions)
+
+            if date in snapshot_dates:
+                career_highs = dict(career_highs)
+                for player_id, position in positions.items():
+                    career_highs[player_id] = min(position, career_highs.get(player_id, position))
+            self.career_highs.append(career_highs)
+
+    def _find(self, date):
+        return bisect_right(self.dates, to_date(date)) - 1
+
+    def ranking_at(self, date):
+        """:return: tuple of ResultRow ordered by ranking position"""
+        i = self._find(date)
+        return self.rankings[i] if i >= 0 else ()
+
+    def career_highs_at(self, date):
+        """:return: dict player_id -> best position in ranking snapshots up to date"""
+        i = self._find(date)
+        return self.career_highs[i] if i >= 0 else {}
+
+    def position_at(self, player_id, date):
+        """:return: player's ranking position at date or None if the player was not ranked"""
+        i = self._find(date)
+        return self.positions[i].get(player_id) if i >= 0 else None
+
+
+# process-level indexes per partition and the data version they were built from,
+# rebuilt lazily after rankings were changed by this or any other process
+_ranking_indexes = {}
+
+
+def get_ranking_index(partition=ALL_PARTITION):
+    version = get_data_version()
+    built = _ranking_indexes.get(partition)
+    if built is None or built[0] != version:
+        rules = get_ranking_rules()
+        rows = partition_rows(load_result_rows(filter_seasons=rules.filter_seasons), partition)
+        built = (version, RankingIndex(rows, rules, snapshot_dates=get_ranking_dates()))
+        _ranking_indexes[partition] = built
+    return built[1]
+
+
+def invalidate_ranking_index():
+    _ranking_indexes.clear()
+
+
+def get_rankings_at(date, partition=ALL_PARTITION):
+    """Ranking table for any date as list of dicts, answered from the ranking index"""
+    index = get_ranking_index(partition)
+    ranked = index.ranking_at(date)
+    return rankings_to_dicts([(i + 1, row.season_id, row.id) for i, row in enumerate(ranked)], to_date(date),
+                             index.career_highs_at(date))
+
+
+def compare_rule_sets(rows, dates, rule_sets):
+    """
+    Evaluate several rule sets on the same result rows.
+
+    :param rows: result rows of all seasons, load_result_rows(filter_seasons='all')
+    :param rule_sets: list of RankingRules, the first one is the baseline
+    :return: dict rules name -> list of (date, player_id, baseline position, position) for every
+        player whose position differs from the baseline (None if not ranked)
+    """
+    baseline, variants = rule_sets[0], rule_sets[1:]
+    baseline_rows = baseline.select_rows(rows)
+
+    expected_by_date = {date: {row.player_id: i + 1 for i, row in enumerate(baseline.rank(baseline_rows, date))}
+                        for date in dates}
+
+    differences = {rules.name: [] for rules in variants}
+    for rules in variants:
+        selected = rules.select_rows(rows)
+        for date in dates:
+            expected = expected_by_date[date]
+            actual = {row.player_id: i + 1 for i, row in enumerate(rules.rank(selected, date))}
+            for player_id in sorted(expected.keys() | actual.keys()):
+                if expected.get(player_id) != actual.get(player_id):
+                    differences[rules.name].append((date, player_id, expected.get(player_id), actual.get(player_id)))
+
+    return differences
@@ -0,0 +1,225 @@
+"""
+Current rankings shared by all worker processes.
+Every ranking rebuild publishes an immutable binary file: a table of player records sorted by id
+(current position, new division, name) and the data of the current rankings page.
+Workers mmap the file and look players up with a binary search directly in the mapping,
+so the rankings page, player search and profile headers are served without database queries.
+The file is replaced atomically, readers map the new file on their next lookup.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import date
+
+from flask import current_app
+
+from cache import get_data_version
+from extensions import db
+from models import Player, Ranking, Season
+from ranking import ALL_PARTITION, get_rankings_data, get_stored_partitions
+
+MAGIC = b'MLRS'
+FORMAT_VERSION = 1
+
+# magic, format version, player count, offset of player records, offset of strings, offset and length of page data
+HEADER = struct.Struct('<4sHxxIIIII')
+# player id, position (0 if not ranked), offset of first and last name in strings,
+# length of first name, length of last name, offset and length of new division
+PLAYER = struct.Struct('<IiIHHIH')
+
+
+def get_ranking_snapshot_file():
+    """
+    Path of the snapshot: RANKING_SNAPSHOT, next to the SQLite database file if it is 'auto'.
+    :return: path or None if there is no shared snapshot
+    """
+    path = current_app.config.get('RANKING_SNAPSHOT', 'auto')
+    if path != 'auto':
+        return path or None
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return url.database + '.rankings'
+
+
+def load_current_rankings():
+    """
+    Current ranking of every ranked player as in Player.get_current_ranking, read from the database.
+    :return: dict player_id -> (position, new_division)
+    """
+    current_date = db.session.query(db.func.max(Ranking.actual_date)).filter(Ranking.partition == ALL_PARTITION).scalar()
+    current = {}
+    if current_date:
+        for row in get_rankings_data(current_date, ALL_PARTITION):
+            current.setdefault(row['player_id'], (row['position'], row['new_division']))
+    return current
+
+
+def build_ranking_snapshot():
+    """:return: snapshot file content for the current database"""
+    latest_season = Season.query.filter(Season.is_completed == True, Season.is_ranked == True) \
+        .order_by(Season.date_end.desc()).first()
+    partitions = get_stored_partitions()
+    seasons = Season.query.order_by(Season.id.desc()).filter(Season.is_ranked == True) \
+        .filter(Season.is_completed == True).all()
+    page = {
+        'actual_date': latest_season.date_end.isoformat() if latest_season else None,
+        'partitions': partitions,
+        'seasons': [{'id': s.id, 'year': s.year, 'name': s.name} for s in seasons],
+        'rankings': {p: get_rankings_data(latest_season.date_end, p) for p in partitions} if latest_season else {},
+    }
+
+    current = load_current_rankings()
+
+    records = []
+    strings = bytearray()
+    for player_id, first_name, last_name in db.session.query(Player.id, Player.first_name, Player.last_name) \
+            .order_by(Player.id):
+        position, new_division = current.get(player_id, (0, ''))
+        names_offset = len(strings)
+        first, last, division = first_name.encode(), last_name.encode(), (new_division or '').encode()
+        strings += first + last
+        division_offset = len(strings)
+        strings += division
+        records.append(PLAYER.pack(player_id, position, names_offset, len(first), len(last),
+                                   division_offset, len(division)))
+
+    page_data = current_app.json.dumps(page).encode()
+    players_offset = HEADER.size
+    strings_offset = players_offset + PLAYER.size * len(records)
+    page_offset = strings_offset + len(strings)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(records), players_offset, strings_offset,
+                         page_offset, len(page_data))
+    return b''.join([header, *records, bytes(strings), page_data])
+
+
+def publish_ranking_snapshot():
+    """
+    Write the snapshot of the current database for all workers, must be invoked inside app context.
+    :return: path of the snapshot file or None if shared snapshots are disabled
+    """
+    path = get_ranking_snapshot_file()
+    if path is None:
+        return None
+    data = build_ranking_snapshot()
+    # end the read transaction, callers publish after their own commit
+    db.session.commit()
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+class RankingSnapshot:
+    """Read-only view of a snapshot file content (bytes or mmap)"""
+
+    def __init__(self, buffer):
+        magic, version, self.player_count, self._players, self._strings, page_offset, page_length = \
+            HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Not a ranking snapshot')
+        self._buffer = buffer
+        self._page_span = (page_offset, page_offset + page_length)
+        self._page = None
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return bytes(self._buffer[start:start + length]).decode()
+
+    def _record(self, i):
+        player_id, position, names, first_length, last_length, division, division_length = \
+            PLAYER.unpack_from(self._buffer, self._players + i * PLAYER.size)
+        return {
+            'id': player_id,
+            'first_name': self._string(names, first_length),
+            'last_name': self._string(names + first_length, last_length),
+            'position': position or None,
+            'new_division': self._string(division, division_length) or None,
+        }
+
+    def player(self, player_id):
+        """:return: dict with id, first_name, last_name, position, new_division or None for an unknown player"""
+        lo, hi = 0, self.player_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_id = struct.unpack_from('<I', self._buffer, self._players + mid * PLAYER.size)[0]
+            if mid_id < player_id:
+                lo = mid + 1
+            elif mid_id > player_id:
+                hi = mid
+            else:
+                return self._record(mid)
+        return None
+
+    def players(self):
+        """All players in id order"""
+        for i in range(self.player_count):
+            yield self._record(i)
+
+    @property
+    def page(self):
+        """Data of the current rankings page: actual_date, partitions, seasons and rankings per partition"""
+        if self._page is None:
+            start, end = self._page_span
+            page = json.loads(bytes(self._buffer[start:end]))
+            page['actual_date'] = date.fromisoformat(page['actual_date']) if page['actual_date'] else None
+            self._page = page
+        return self._page
+
+
+# mapped snapshot of this process and the (device, inode, mtime) of the file it was read from
+_mapped = {}
+_mapped_lock = threading.Lock()
+
+
+def get_ranking_snapshot():
+    """
+    Snapshot of the current rankings published by any process, must be invoked inside app context.
+    :return: RankingSnapshot or None if there is none
+    """
+    path = get_ranking_snapshot_file()
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    file_id = (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+    with _mapped_lock:
+        if _mapped.get('path') == path and _mapped.get('file_id') == file_id:
+            return _mapped['snapshot']
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            snapshot = RankingSnapshot(buffer)
+        except (OSError, ValueError, struct.error):
+            return None
+        # the previous mapping is released when no request uses it anymore
+        _mapped.update(path=path, file_id=file_id, snapshot=snapshot)
+        return snapshot
+
+
+# process-level current rankings and the data they were read from
+_current_rankings = {}
+
+
+def get_current_rankings():
+    """
+    Current ranking of every ranked player, read again after rankings were rebuilt by any process.
+    Must be invoked inside app context.
+    :return: dict player_id -> (position, new_division)
+    """
+    snapshot = get_ranking_snapshot()
+    # the snapshot object is replaced whenever its file was published again
+    version = (get_data_version(), snapshot)
+    if _current_rankings.get('version') != version:
+        if snapshot is not None:
+            current = {p['id']: (p['position'], p['new_division']) for p in snapshot.players() if p['position']}
+        else:
+            current = load_current_rankings()
+        _current_rankings.update(current=current, version=version)
+    return _current_rankings['current']
@@ -0,0 +1,45 @@
+"""
+Per-client token bucket rate limiting of cheap, frequent API calls (player autocomplete).
+Every client gets a bucket of `burst` tokens refilled at `rate` tokens per second, a request takes
+one token. Buckets of the least recently seen clients are dropped above max_clients.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """Token buckets per client key"""
+
+    def __init__(self, rate, burst, max_clients=10000, clock=time.monotonic):
+        """
+        :param rate: tokens added per second, 0 disables the limiter
+        :param burst: bucket size, requests a client may make at once
+        :param max_clients: buckets kept in memory
+        :param clock: callable returning seconds, for tests
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, client):
+        """
+        Take a token from the bucket of client.
+        :return: (allowed, seconds until the next token if not allowed)
+        """
+        if not self.rate:
+            return True, 0.
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return allowed, 0. if allowed else (1 - tokens) / self.rate
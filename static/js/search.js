@@ -59,6 +59,11 @@ class PlayerSearch {
             this.showLoading();
 
             const response = await fetch(`/api/search-players?q=${encodeURIComponent(query)}`);
+            if (response.status === 429) {
+                // rate limited: keep showing the previous results
+                this.displaySearchResults(this.currentSearchResults);
+                return;
+            }
             const players = await response.json();
 
             this.currentSearchResults = players;
@@ -1,34 +1,57 @@
 # tests/conftest.py
 import os
+import shutil
 import sys
+import tempfile
 import pytest
+from contextlib import contextmanager
 from datetime import date
+from types import SimpleNamespace
 
 # Add the parent directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# the engine is created with the app on import: tests run on a SQLite file of their own,
+# never on instance/database.db or a database configured in the environment
+_database_dir = tempfile.mkdtemp(prefix='tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+
 from app import app as real_app
+from config import Config
 from extensions import db
-from models import League, Season, Division, Player, Result
+from init import create_app
+from sqlalchemy import event
+from models import League, Season, Division, Player, Result, invalidate_season_aliases
+from ranking import invalidate_ranking_index
+from cache import bump_data_version
+from ranking_snapshot import publish_ranking_snapshot
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_database_dir, ignore_errors=True)
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     """Create and configure a new app instance for each test."""
     # Create the app with test config
 
     real_app.config.update({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
         'WTF_CSRF_ENABLED': False,
-        'SERVER_NAME': 'localhost'
+        'SERVER_NAME': 'localhost',
+        'RANKING_SNAPSHOT': str(tmp_path / 'rankings.snapshot'),
     })
 
     # Create the database and load test data
     with real_app.app_context():
         db.create_all()
         load_test_data(db)
+        publish_ranking_snapshot()
+    invalidate_ranking_index()
+    invalidate_season_aliases()
+    bump_data_version()
 
     yield real_app
 
@@ -36,6 +59,48 @@ def app():
         db.drop_all()
 
 
+@pytest.fixture
+def app_factory():
+    """Create apps of their own from Config with some settings overridden: app_factory(TRUSTED_PROXIES=1)"""
+    def factory(**overrides):
+        config = {k: getattr(Config, k) for k in dir(Config) if k.isupper()}
+        config.update(overrides)
+        return create_app(SimpleNamespace(**config))
+    return factory
+
+
+@pytest.fixture
+def count_queries():
+    """Collect SQL statements run inside the block, in an app context: with count_queries() as queries"""
+    @contextmanager
+    def counter():
+        queries = []
+        engine = db.engine
+
+        def listener(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            yield queries
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+    return counter
+
+
+@pytest.fixture
+def bump_version(monkeypatch):
+    """
+    Simulate a write by another process to the modules given: their data version changes,
+    the counter of this process does not.
+    """
+    def bump(*modules):
+        for module in modules:
+            version = module.get_data_version()
+            monkeypatch.setattr(module, 'get_data_version', lambda version=version: version + ('changed',))
+    return bump
+
+
 @pytest.fixture
 def client(app):
     """A test client for the app."""
@@ -0,0 +1,71 @@
+# tests/test_build.py
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from build import BuildNode, build_levels, run_build
+
+
+def test_build_only_stale_nodes(app):
+    """Nodes are rebuilt only after their inputs changed."""
+    from app import BUILD_NODES
+    from extensions import db
+    from models import Result, Ranking
+
+    def statuses(**kwargs):
+        return {name: status for name, status, _ in run_build(app, BUILD_NODES, **kwargs)}
+
+    assert statuses(dry_run=True) == {'rankings': 'stale', 'matches': 'stale'}
+    assert statuses() == {'rankings': 'built', 'matches': 'built'}
+    assert statuses() == {'rankings': 'fresh', 'matches': 'fresh'}
+
+    with app.app_context():
+        assert Ranking.query.count() > 0
+        result = Result.query.filter_by(position=1).first()
+        result.position = 6
+        db.session.commit()
+
+    # matches depend on who played in which division, not on positions
+    assert statuses() == {'rankings': 'built', 'matches': 'fresh'}
+    assert statuses(force=['matches']) == {'rankings': 'fresh', 'matches': 'built'}
+
+    with app.app_context():
+        from datetime import date
+        from models import Division, Match, Player
+
+        # a match imported from another file, in the lower division of Season 1
+        player1, player2 = Player.query.order_by(Player.id).limit(2)
+        low, high = Division.query.filter_by(season_id=1).order_by(Division.priority)
+        db.session.add(Match(date_played=date(2024, 1, 10), season_id=1, division_id=low.id, player1_id=player1.id,
+                             player2_id=player2.id, winner_id=player1.id, content_hash='watched'))
+        db.session.commit()
+        high_id = high.id
+
+    # the match is kept and its division resolved again
+    assert statuses(force=['matches']) == {'rankings': 'fresh', 'matches': 'built'}
+    with app.app_context():
+        assert Match.query.filter_by(content_hash='watched').one().division_id == high_id
+
+
+def test_build_graph_order(app):
+    """Dependent nodes run after their dependencies and are rebuilt with them."""
+    runs = []
+    fingerprints = {'a': '1', 'b': '1', 'c': '1'}
+
+    def node(name, deps=()):
+        return BuildNode(name, inputs=lambda: [fingerprints[name]], run=lambda: runs.append(name), deps=deps)
+
+    nodes = [node('c', deps=['a', 'b']), node('a'), node('b')]
+    assert [[n.name for n in level] for level in build_levels(nodes)] == [['a', 'b'], ['c']]
+
+    run_build(app, nodes)
+    assert sorted(runs[:2]) == ['a', 'b'] and runs[2] == 'c'
+
+    runs.clear()
+    fingerprints['a'] = '2'
+    assert [(name, status) for name, status, _ in run_build(app, nodes)] == \
+        [('a', 'built'), ('b', 'fresh'), ('c', 'built')]
+
+    with pytest.raises(ValueError):
+        build_levels([node('a', deps=['b']), node('b', deps=['a'])])
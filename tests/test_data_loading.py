@@ -4,8 +4,10 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import json
+import pytest
 from io import StringIO
-from app import input_data_from_json, delete_all, reset_content
+from app import input_data_from_json, delete_all, reset_content, import_matches_from_csv, iter_json_leagues, \
+    import_appended_matches
 from extensions import db
 from models import League, Season, Division, Player, Result, Ranking, Match
 
@@ -104,3 +106,313 @@ def test_content_reset(client, app):
         assert Ranking.query.count() == 481
         assert Match.query.count() == 993
 
+
+
+def test_import_matches_from_csv(app, tmp_path):
+    """Matches are resolved against the preloaded season/division index."""
+    csv_path = tmp_path / 'matches.csv'
+    csv_path.write_text(
+        'winner,loser,score,season,date\n'
+        'Test1 Player1,Test2 Player2,6-3 6-7 (5/7) [10/8],Tashkent Masters League,2024-01-10\n'
+        'Test3 Player3,Test4 Player4,7-6 (7/4) 6-2,Tashkent Masters League. Season 2,2024-02-10\n'
+        'Test1 Player1,Unknown Player,6-0 6-0,Tashkent Masters League,2024-01-11\n'
+        'Test1 Player1,Test2 Player2,6-0 6-0,Unknown Season,2024-01-12\n'
+        'Test1 Player1,Test2 Player2,,Tashkent Masters League,2024-01-13\n'
+        'Тест3 Плэйер3,Test5 Player5,6-1 6-1,Tashkent Masters League. Season 2,2024-02-11\n',
+        encoding='utf-8')
+
+    with app.app_context():
+        # a misspelled name is only a suggestion until the import accepts close names
+        events = []
+        assert import_matches_from_csv(str(csv_path), batch_size=1, progress=events.append) == \
+            {'imported': 2, 'skipped': 4, 'existing': 0, 'errors': 0}
+        player3 = Player.query.filter_by(first_name='Player3').one()
+        assert [e['suggestions'] for e in events if e.get('suggestions')] == [{'Тест3 Плэйер3': player3.id}]
+
+        assert import_matches_from_csv(str(csv_path), batch_size=1, upsert=True, fuzzy=True) == \
+            {'imported': 1, 'skipped': 3, 'existing': 2, 'errors': 0}
+
+        first, second, third = Match.query.order_by(Match.date_played).all()
+        # transliterated and misspelled name resolved to the closest player
+        assert (third.winner.first_name, third.player2.first_name) == ('Player3', 'Player5')
+        # both players have results in M1 and M2: the division with max priority is selected
+        assert (first.season_id, first.division.name) == (1, 'M2')
+        assert first.player1.first_name == first.winner.first_name == 'Player1'
+        assert (first.set1_player1, first.set1_player2, first.set2_player1, first.set2_player2) == (6, 3, 6, 7)
+        assert (first.tb2_player1, first.tb2_player2) == (5, 7)
+        assert (first.royal_tiebreak_player1, first.royal_tiebreak_player2) == (10, 8)
+        assert first.set3_player1 is None
+        assert second.season_id == 2
+        assert (second.tb1_player1, second.tb1_player2, second.tb2_player1) == (7, 4, None)
+
+
+def test_iter_json_leagues():
+    """Streaming reader yields the same structure as json.load, whatever the chunk size."""
+    data = {
+        "League A": [{"name": "1", "divisions": [{"name": "M1", "results": [{"first_name": "Ана [1]"}]}]},
+                     {"name": "2 }, {", "divisions": []}],
+        "Empty League": [],
+        "League B": [{"name": "3"}],
+    }
+    text = json.dumps(data, indent=2, ensure_ascii=False)
+
+    for chunk_size in (1, 7, 65536):
+        streamed = {league: list(seasons) for league, seasons in iter_json_leagues(StringIO(text), chunk_size)}
+        assert streamed == data
+
+    # seasons left unconsumed are skipped
+    assert [league for league, _ in iter_json_leagues(StringIO(text), 3)] == list(data)
+    assert list(iter_json_leagues(StringIO('{}'))) == []
+
+
+def test_import_matches_upsert(app, tmp_path):
+    """Re-importing a grown file inserts only the new rows."""
+    header = 'winner,loser,score,season,date\n'
+    first_week = 'Test1 Player1,Test2 Player2,6-3 6-3,Tashkent Masters League,2024-01-10\n' \
+                 'Test3 Player3,Test4 Player4,6-4  6-4,Tashkent Masters League,2024-01-10\n'
+    second_week = 'Test3 Player3,Test4 Player4,6-4 6-4,Tashkent Masters League,2024-01-10\n' \
+                  'Test2 Player2,Test5 Player5,6-1 6-1,Tashkent Masters League,2024-01-17\n'
+    csv_path = tmp_path / 'matches.csv'
+
+    with app.app_context():
+        csv_path.write_text(header + first_week, encoding='utf-8')
+        assert import_matches_from_csv(str(csv_path), upsert=True)['imported'] == 2
+
+        # the rematch with the same score is a different row of the file
+        csv_path.write_text(header + first_week + second_week, encoding='utf-8')
+        counts = import_matches_from_csv(str(csv_path), batch_size=1, upsert=True)
+        assert (counts['imported'], counts['existing']) == (2, 2)
+        assert Match.query.count() == 4
+
+        counts = import_matches_from_csv(str(csv_path), upsert=True)
+        assert (counts['imported'], counts['existing']) == (0, 4)
+        assert Match.query.count() == 4
+
+
+def test_import_appended_matches(app, tmp_path):
+    """Only complete rows appended since the previous scan are imported."""
+    csv_path = tmp_path / 'week.csv'
+    (tmp_path / 'notes.txt').write_text('not a match file\n')
+    csv_path.write_bytes(
+        b'winner,loser,score,season,date\n'
+        b'Test1 Player1,Test2 Player2,6-3 6-3,Tashkent Masters League,2024-01-10\n'
+        b'Test3 Player3,Test4 Player4,6-4 6-')
+
+    with app.app_context():
+        state = {}
+        imported = import_appended_matches(str(tmp_path), state)
+        assert imported['week.csv']['imported'] == 1
+        assert state['week.csv']['rows'] == 1
+        assert import_appended_matches(str(tmp_path), state) == {}
+
+        with open(csv_path, 'ab') as f:
+            f.write(b'4,Tashkent Masters League,2024-01-11\n')
+        imported = import_appended_matches(str(tmp_path), state)
+        assert list(imported) == ['week.csv']
+        assert imported['week.csv']['imported'] == 1
+        assert state['week.csv']['offset'] == csv_path.stat().st_size
+
+        # an identical row appended later is another match, not the one imported before
+        with open(csv_path, 'ab') as f:
+            f.write(b'Test1 Player1,Test2 Player2,6-3 6-3,Tashkent Masters League,2024-01-10\n')
+        imported = import_appended_matches(str(tmp_path), state)
+        assert (imported['week.csv']['imported'], imported['week.csv']['existing']) == (1, 0)
+
+        # a replaced file is read from the start, rows stored before are not duplicated
+        csv_path.write_bytes(b'winner,loser,score,season,date\n'
+                             b'Test1 Player1,Test2 Player2,6-3 6-3,Tashkent Masters League,2024-01-10\n')
+        imported = import_appended_matches(str(tmp_path), state)
+        assert (imported['week.csv']['imported'], imported['week.csv']['existing']) == (0, 1)
+        assert Match.query.count() == 3
+
+
+def test_season_aliases(app, tmp_path, bump_version):
+    """Season aliases are stored in the database and survive a content reset."""
+    from models import SeasonAlias, get_season_aliases, get_season_by_raketo_name, set_season_alias
+
+    csv_path = tmp_path / 'matches.csv'
+    csv_path.write_text('winner,loser,score,season,date\n'
+                        'Test1 Player1,Test2 Player2,6-3 6-3,Test Cup 2024,2024-03-10\n', encoding='utf-8')
+
+    with app.app_context():
+        assert get_season_aliases()['Tashkent Masters League'] == 1
+        assert 'Test Cup 2024' not in get_season_aliases()
+        assert import_matches_from_csv(str(csv_path))['skipped'] == 1
+
+        set_season_alias('Test Cup 2024', 3)
+        assert get_season_by_raketo_name('Test Cup 2024').name == 'Season 3'
+        assert import_matches_from_csv(str(csv_path))['imported'] == 1
+
+        set_season_alias('Test Cup 2024', 2)
+        assert get_season_aliases()['Test Cup 2024'] == 2
+
+        # alias added by another process (manage.py add-season-alias): the cache of this one is not invalidated
+        import models
+        db.session.add(SeasonAlias(alias='Test Cup 2025', season_id=3))
+        db.session.commit()
+        csv_path.write_text(csv_path.read_text(encoding='utf-8').replace('Test Cup 2024', 'Test Cup 2025'),
+                            encoding='utf-8')
+        assert import_matches_from_csv(str(csv_path))['imported'] == 1
+        bump_version(models)
+        assert get_season_aliases()['Test Cup 2025'] == 3
+
+        aliases = SeasonAlias.query.count()
+        delete_all()
+        assert SeasonAlias.query.count() == aliases
+
+
+def test_rebuild_database_file(tmp_path, app_factory):
+    """Content is rebuilt in a new file which replaces the live one."""
+    from sqlalchemy import text
+    from app import rebuild_database_file
+    from models import SeasonAlias, set_season_alias
+
+    live_app = app_factory(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'live.db'}")
+
+    with live_app.app_context():
+        db.create_all()
+        db.session.add(Player(first_name='Old', last_name='Content'))
+        db.session.commit()
+        set_season_alias('Custom Cup', 1)
+
+        reader = db.engine.connect()
+        assert rebuild_database_file() == str(tmp_path / 'live.db')
+        assert not (tmp_path / 'live.db.build').exists()
+
+        # connections opened before the swap keep reading the previous file
+        assert reader.execute(text('SELECT count(*) FROM Player')).scalar() == 1
+        reader.close()
+
+        assert Player.query.filter_by(first_name='Old').count() == 0
+        assert League.query.count() == 1
+        assert Ranking.query.count() > 0
+        assert Match.query.count() > 0
+        assert SeasonAlias.query.filter_by(alias='Custom Cup').one().season_id == 1
+
+
+def test_import_after_database_swap(tmp_path, app_factory):
+    """Matches are not written to a replaced database file, watched files are imported again into the new one."""
+    import shutil
+    from conftest import load_test_data
+    from app import DatabaseReplacedError, import_match_rows
+
+    live_path, build_path = tmp_path / 'live.db', tmp_path / 'live.db.build'
+    live_app = app_factory(SQLALCHEMY_DATABASE_URI=f"sqlite:///{live_path}")
+    watched = tmp_path / 'watched'
+    watched.mkdir()
+    (watched / 'week.csv').write_text('winner,loser,score,season,date\n'
+                                      'Test1 Player1,Test2 Player2,6-3 6-3,Tashkent Masters League,2024-01-10\n')
+
+    with live_app.app_context():
+        db.create_all()
+        load_test_data(db)
+        # content of a rebuild, it does not have the watched matches
+        shutil.copy(live_path, build_path)
+
+        state = {}
+        assert import_appended_matches(str(watched), state)['week.csv']['imported'] == 1
+        os.replace(build_path, live_path)
+        imported = import_appended_matches(str(watched), state)
+        assert imported['week.csv']['imported'] == 1
+        assert Match.query.count() == 1
+        assert import_appended_matches(str(watched), state) == {}
+
+        # swapped in the middle of an import: the rest is not written with ids of the previous file
+        shutil.copy(live_path, build_path)
+        rows = [(i, {'winner': 'Test3 Player3', 'loser': 'Test4 Player4', 'score': '6-4 6-4',
+                     'season': 'Tashkent Masters League', 'date': f'2024-01-1{i}'}) for i in range(2)]
+
+        def swap(event):
+            if event['event'] == 'batch':
+                os.replace(build_path, live_path)
+
+        with pytest.raises(DatabaseReplacedError):
+            import_match_rows(rows, batch_size=1, progress=swap)
+
+
+def test_database_snapshot(tmp_path, app_factory):
+    """Snapshot is loaded only while the data files it was built from are unchanged."""
+    import shutil
+    from app import build_database_file, load_database_snapshot
+
+    results_json = tmp_path / 'results.json'
+    shutil.copy('data/actual_results.json', results_json)
+    live_app = app_factory(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'live.db'}",
+                           ACTUAL_RESULTS_JSON=str(results_json))
+
+    with live_app.app_context():
+        build_database_file(str(tmp_path / 'snapshot.db'))
+        assert not load_database_snapshot(str(tmp_path / 'missing.db'))
+        assert load_database_snapshot(str(tmp_path / 'snapshot.db'))
+        assert League.query.count() == 1
+        assert Ranking.query.count() > 0
+
+        # a database with content is only replaced on request, matches imported since would be lost
+        Match.query.delete()
+        db.session.commit()
+        assert not load_database_snapshot(str(tmp_path / 'snapshot.db'))
+        assert Match.query.count() == 0
+        assert load_database_snapshot(str(tmp_path / 'snapshot.db'), force=True)
+        assert Match.query.count() > 0
+
+        with open(results_json, 'a') as f:
+            f.write('\n')
+        assert not load_database_snapshot(str(tmp_path / 'snapshot.db'), force=True)
+
+
+def test_check_consistency(app, tmp_path):
+    """Result counters are compared with aggregates of the imported matches."""
+    from datetime import datetime
+    from consistency import check_consistency
+
+    with app.app_context():
+        players = Player.query.order_by(Player.id).all()
+        division = Division.query.filter_by(season_id=1, name='M1').first()
+        p1, p2, p3 = (p.id for p in players[:3])
+        db.session.add_all([
+            Match(date_played=datetime(2024, 1, 10), season_id=1, division_id=division.id,
+                  player1_id=p1, player2_id=p2, winner_id=p1, set1_player1=6, set1_player2=3,
+                  set2_player1=4, set2_player2=6, royal_tiebreak_player1=10, royal_tiebreak_player2=7),
+            Match(date_played=datetime(2024, 1, 11), season_id=1, division_id=division.id,
+                  player1_id=p3, player2_id=p1, winner_id=p1, set1_player1=1, set1_player2=6,
+                  set2_player1=2, set2_player2=6),
+        ])
+        # match_count, win_count, set_diff, game_diff, the royal tiebreak is one set and one game
+        expected = {p1: (2, 2, 3, 11), p2: (1, 0, -1, -2), p3: (1, 0, -2, -9)}
+        for result in Result.query.filter_by(division_id=division.id):
+            result.match_count, result.win_count, result.set_diff, result.game_diff = \
+                expected.get(result.player_id, (0, 0, 0, 0))
+        db.session.commit()
+
+        report = check_consistency()
+        assert report['mismatches'] == report['fallback'] == report['no_division'] == []
+        assert (report['divisions'], report['players']) == (1, 5)
+
+        Result.query.filter_by(division_id=division.id, player_id=p2).first().game_diff = -3
+        # p3 played in the division without a result there, as after the lowest division fallback
+        Result.query.filter_by(division_id=division.id, player_id=p3).delete()
+        newcomer = Player(first_name='Player6', last_name='Test6')
+        db.session.add(newcomer)
+        db.session.commit()
+
+        skipped = []
+        csv_path = tmp_path / 'matches.csv'
+        csv_path.write_text('winner,loser,score,season,date\n'
+                            'Test1 Player1,Test6 Player6,6-3 6-3,Tashkent Masters League,2024-01-12\n')
+        assert import_matches_from_csv(str(csv_path), dry_run=True, progress=skipped.append)['skipped'] == 1
+        assert Match.query.count() == 2
+
+        report = check_consistency(skipped)
+        assert [tuple(m) for m in report['mismatches']] == [(division.id, p2, 'game_diff', -2, -3)]
+        assert report['fallback'] == [(division.id, p3, 1)]
+        assert [(e['row'], e['season_id'], e['player_ids']) for e in report['no_division']] == \
+            [(0, 1, [p1, newcomer.id])]
+
+        # known differences are kept in a baseline, only new ones are reported
+        from consistency import describe_differences, load_baseline, save_baseline, new_differences
+        differences = describe_differences(report, lambda player_id: f'player {player_id}')
+        assert len(differences) == 3
+        baseline_path = str(tmp_path / 'baseline.txt')
+        assert load_baseline(baseline_path) == {}
+        save_baseline(baseline_path, differences[:2])
+        assert new_differences(differences, load_baseline(baseline_path)) == differences[2:]
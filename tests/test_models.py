@@ -1,9 +1,11 @@
 # tests/test_models.py
 import os
 import sys
+import pytest
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models import Player, League, Season, Division, Result, Ranking, get_division_name
+from models import Player, League, Season, Division, Result, Ranking, get_division_name, \
+    SCORE_COLUMNS, ScoreParseError, parse_score_columns, parse_scores
 
 
 def test_get_division_name():
@@ -103,4 +105,23 @@ def test_season_to_dict():
     season = Season(name='Test', year=2024)
     season_dict = season.to_dict()
     assert season_dict['name'] == 'Test'
-    assert season_dict['year'] == 2024
\ No newline at end of file
+    assert season_dict['year'] == 2024
+
+def test_parse_scores():
+    """Scores are parsed into Match column values."""
+    columns = dict(zip(SCORE_COLUMNS, parse_score_columns('7-6 (7/4)  3-6 (5/7) [10/8]')))
+    assert (columns['set1_player1'], columns['set1_player2'], columns['tb1_player1'], columns['tb1_player2']) == (7, 6, 7, 4)
+    assert (columns['set2_player1'], columns['tb2_player2']) == (3, 7)
+    assert (columns['royal_tiebreak_player1'], columns['royal_tiebreak_player2']) == (10, 8)
+    assert columns['set3_player1'] is None
+
+    assert parse_scores(['6-3 6-3', '6-4 3-6 7-5', '9-8 (7/2)']) == [
+        (6, 3, 6, 3) + (None,) * 10,
+        (6, 4, 3, 6, 7, 5) + (None,) * 8,
+        (9, 8) + (None,) * 4 + (7, 2) + (None,) * 6,
+    ]
+
+    with pytest.raises(ScoreParseError) as error:
+        parse_scores(['6-3 6-3', '6-3 w/o'], start=10)
+    assert error.value.row == 11
+    assert str(error.value) == 'row 11: Could not parse score: 6-3 w/o'
@@ -0,0 +1,81 @@
+# tests/test_names.py
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from names import PlayerNameIndex, BKTree, normalize_name, levenshtein
+
+
+def test_normalize_name():
+    """Alphabet, case and common latin spelling variants do not change the key."""
+    assert normalize_name('Таджиев Хамдам') == normalize_name('TADZHIEV  Khamdam') == normalize_name('Tadjiev Xamdam')
+    assert normalize_name('Фёдор Юрьев') == normalize_name('Fedor Iurev')
+    assert normalize_name("Mahmudov O'tkir") == 'mahmudov otkir'
+
+
+def test_player_name_index():
+    """Near-miss names resolve to the only closest player, ties and far names do not resolve."""
+    index = PlayerNameIndex([(1, 'Farrukh', 'Shamuratov'), (2, 'Ruslan', 'Khaleulin'),
+                             (3, 'Anton', 'Ivanov'), (4, 'Anna', 'Ivanova')])
+
+    assert index.resolve('Shamuratov Farrukh') == 1
+    assert index.resolve('Farukh Shamuratov') == 1
+    assert index.resolve('Xaleulin Ruslan') == 2
+    assert index.resolve('Халеулин Руслан') == 2
+    assert index.resolve('Ivanov Anton') == 3
+    assert index.candidates('Ivanov Anton', max_distance=5) == [(3, 0), (4, 4)]
+    assert index.resolve('Ivanov Antn') == 3
+    assert index.resolve('Petrov Anton') is None
+
+    tie = PlayerNameIndex([(1, 'Alex', 'Kim'), (2, 'Alex', 'Lim')])
+    assert tie.resolve('Alex Jim') is None
+
+
+def test_bk_tree_matches_linear_scan():
+    words = ['shamuratov', 'shamuradov', 'xaleulin', 'ivanov', 'ivanova', 'petrov', 'petrova', 'kim', 'lim']
+    tree = BKTree()
+    for word in words:
+        tree.add(word)
+    for query in ['ivanof', 'shamurat', 'kin', 'petro']:
+        for max_distance in (1, 2, 3):
+            expected = sorted((levenshtein(query, w), w) for w in words if levenshtein(query, w) <= max_distance)
+            assert sorted(tree.search(query, max_distance)) == expected
+
+
+def test_player_search_index():
+    """Search finds name substrings in both alphabets and name orders, ranked players first."""
+    from names import PlayerSearchIndex
+
+    index = PlayerSearchIndex([
+        {'id': 1, 'first_name': 'Alisher', 'last_name': 'Sharopov', 'position': None},
+        {'id': 2, 'first_name': 'Alisher', 'last_name': 'Razzakov', 'position': 6},
+        {'id': 3, 'first_name': 'Руслан', 'last_name': 'Халеулин', 'position': 4},
+        {'id': 4, 'first_name': 'Arslan', 'last_name': 'Aliev', 'position': 2},
+    ])
+
+    def ids(query):
+        return [p['id'] for p in index.search(query)]
+
+    assert ids('ali') == [4, 2, 1]
+    assert ids('ruslan') == ids('Руслан') == ids('xaleulin ruslan') == [3]
+    assert ids('Kha') == [3]
+    assert ids('al sh') == [1]
+    assert ids('sherzod') == []
+    assert ids('slan') == [4, 3]
+
+
+def test_player_name_index_follows_data_version(app, bump_version):
+    """Process-level name index sees players added by any process."""
+    import names
+    from extensions import db
+    from models import Player
+
+    with app.app_context():
+        index = names.get_player_name_index()
+        assert names.get_player_name_index() is index
+        assert index.resolve('Newcomer Player') is None
+
+        db.session.add(Player(first_name='Player', last_name='Newcomer'))
+        db.session.commit()
+        bump_version(names)
+        assert names.get_player_name_index().resolve('Newcomer Player') is not None
@@ -0,0 +1,291 @@
+# tests/test_ranking.py
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date
+from app import calculate_rankings
+from models import Player, Ranking, get_last_result_before_date
+from ranking import load_result_rows, rank_players
+
+
+def test_rank_players_matches_per_player_lookup(app):
+    """In-memory selection must pick the same result as get_last_result_before_date."""
+    with app.app_context():
+        target_date = date(2024, 2, 28)
+        ranked = rank_players(load_result_rows(), target_date)
+
+        assert len(ranked) == Player.query.count()
+        for row in ranked:
+            expected = get_last_result_before_date(row.player_id, target_date, 'ranked', 365)
+            assert expected.id == row.id
+
+
+def test_calculate_rankings(app):
+    """Test calculate_rankings stores one ranking row per player."""
+    with app.app_context():
+        rankings = calculate_rankings(date(2024, 3, 28))
+
+        assert len(rankings) == 5
+        assert Ranking.query.filter_by(actual_date=date(2024, 3, 28)).count() == 5
+        assert [r.position for r in rankings] == [1, 2, 3, 4, 5]
+        # conftest results: player i finishes i-th in every division
+        assert [r.player_ref.first_name for r in rankings] == [f'Player{i}' for i in range(1, 6)]
+
+
+def test_update_rankings_keeps_past_snapshots(app):
+    """Only snapshots from the new season on are recalculated."""
+    with app.app_context():
+        from app import update_rankings
+        from extensions import db
+        from models import Season, Division, Result
+
+        assert update_rankings() == [date(2024, 1, 28), date(2024, 2, 28), date(2024, 3, 28)]
+        assert update_rankings() == []
+        old_ids = sorted(r.id for r in Ranking.query.all())
+
+        season = Season(name='Season 4', year=2024, is_ranked=True, is_completed=False,
+                        date_start=date(2024, 4, 1), date_end=date(2024, 4, 28), league_id=1)
+        db.session.add(season)
+        db.session.flush()
+        division = Division(name='SemiPro', priority=50, season_id=season.id)
+        db.session.add(division)
+        db.session.flush()
+        player = Player.query.filter_by(first_name='Player5').first()
+        db.session.add(Result(player_id=player.id, position=1, match_count=5, win_count=5,
+                              division_id=division.id, relegation='unchanged'))
+        db.session.commit()
+
+        # a season in progress is not ranked until it is completed
+        assert update_rankings() == []
+        season.is_completed = True
+        db.session.commit()
+
+        assert update_rankings() == [date(2024, 4, 28)]
+        assert sorted(r.id for r in Ranking.query.filter(Ranking.actual_date < date(2024, 4, 28))) == old_ids
+
+        leader = Ranking.query.filter_by(actual_date=date(2024, 4, 28), position=1).first()
+        assert leader.player_id == player.id
+
+        assert update_rankings(season_ids=[season.id]) == [date(2024, 4, 28)]
+        assert Ranking.query.filter_by(partition='all', actual_date=date(2024, 4, 28)).count() == 5
+
+        # an edited result of an earlier season is detected without season_ids
+        result = Result.query.join(Division).filter(Division.season_id == 2, Result.player_id == player.id).first()
+        result.position = 1
+        db.session.commit()
+        assert update_rankings() == [date(2024, 2, 28), date(2024, 3, 28), date(2024, 4, 28)]
+        assert update_rankings() == []
+
+
+def test_rebuild_rankings_parallel(app):
+    """Snapshots computed in worker processes equal the serial ones."""
+    with app.app_context():
+        from app import rebuild_rankings
+        from ranking import compute_snapshots, get_ranking_dates
+
+        rows = load_result_rows()
+        dates = get_ranking_dates()
+        assert compute_snapshots(rows, dates, jobs=2) == compute_snapshots(rows, dates, jobs=1)
+
+        # 3 dates x (5 players in 'all' + 2 male + 3 female)
+        assert rebuild_rankings(jobs=2) == 30
+        assert Ranking.query.count() == 30
+        assert rebuild_rankings(jobs=1) == 30
+        assert Ranking.query.filter_by(partition='all').count() == 15
+
+
+def test_delta_ranking_storage(app):
+    """Rankings restored from deltas equal fully stored snapshots."""
+    with app.app_context():
+        from app import rebuild_rankings, update_rankings
+        from models import RankingDelta
+        from ranking import get_rankings_data, get_ranking_dates
+
+        def without_ids(rows):
+            return [{k: v for k, v in r.items() if k != 'id'} for r in rows]
+
+        rebuild_rankings()
+        full = {d: without_ids(get_rankings_data(d)) for d in get_ranking_dates()}
+
+        app.config['RANKING_STORAGE'] = 'delta'
+        try:
+            rebuild_rankings()
+            assert RankingDelta.query.filter_by(partition='all', actual_date=date(2024, 1, 28)).count() == 5
+            assert Ranking.query.filter_by(partition='all').count() == 5
+            assert update_rankings() == []
+            assert {d: without_ids(get_rankings_data(d)) for d in get_ranking_dates()} == full
+        finally:
+            app.config['RANKING_STORAGE'] = 'full'
+
+
+def test_last_rankings_after_expiry(app):
+    """Players whose results expired keep their last position and career high in both storages."""
+    with app.app_context():
+        from app import rebuild_rankings
+        from extensions import db
+        from models import Season, Division, Result
+        from ranking import load_last_rankings
+
+        # a year later only Player5 played: the results of everybody else expired
+        season = Season(name='Season 2025', year=2025, is_ranked=True, is_completed=True,
+                        date_start=date(2025, 6, 1), date_end=date(2025, 6, 28), league_id=1)
+        db.session.add(season)
+        db.session.flush()
+        division = Division(name='SemiPro', priority=50, season_id=season.id)
+        db.session.add(division)
+        db.session.flush()
+        player5 = Player.query.filter_by(first_name='Player5').first()
+        db.session.add(Result(player_id=player5.id, position=1, match_count=5, win_count=5,
+                              division_id=division.id, relegation='unchanged'))
+        db.session.commit()
+        player1 = Player.query.filter_by(first_name='Player1').first()
+
+        rebuild_rankings()
+        full = load_last_rankings()
+        assert (full[player1.id].actual_date, full[player1.id].position) == (date(2024, 3, 28), 1)
+        assert full[player5.id].actual_date == date(2025, 6, 28)
+
+        app.config['RANKING_STORAGE'] = 'delta'
+        try:
+            rebuild_rankings()
+            assert Ranking.query.filter_by(partition='all').count() == 1
+            assert load_last_rankings() == full
+            assert load_last_rankings(player_id=player1.id) == {player1.id: full[player1.id]}
+            assert player1.calculate_total_stats()['career_high'] == 1
+        finally:
+            app.config['RANKING_STORAGE'] = 'full'
+
+
+def test_ranking_index_matches_engine(app):
+    """Ranking index answers any date like a full engine run."""
+    with app.app_context():
+        from datetime import timedelta
+        from ranking import RankingIndex
+
+        rows = load_result_rows()
+        index = RankingIndex(rows)
+
+        day = date(2023, 12, 1)
+        while day < date(2025, 6, 1):
+            assert list(index.ranking_at(day)) == rank_players(rows, day, expire_days=365)
+            day += timedelta(days=7)
+
+        assert index.ranking_at(date(2024, 1, 27)) == ()
+        assert index.position_at(rows[0].player_id, date(2024, 1, 28)) == 1
+        assert index.position_at(rows[0].player_id, date(2025, 3, 29)) is None  # expired
+
+
+def test_ranking_index_follows_data_version(app, bump_version):
+    """Process-level ranking index is rebuilt after the data was changed by any process."""
+    with app.app_context():
+        import ranking
+        from ranking import get_ranking_index
+
+        index = get_ranking_index()
+        assert get_ranking_index() is index
+
+        # another process wrote the database: the counter of this one is unchanged, the file stat is not
+        bump_version(ranking)
+        assert get_ranking_index() is not index
+
+
+def test_career_high(app):
+    """Career high is kept across snapshots and used by the profile stats."""
+    with app.app_context():
+        from app import rebuild_rankings, update_rankings
+        from extensions import db
+        from models import Season, Division, Result
+
+        rebuild_rankings()
+        season = Season(name='Season 4', year=2024, is_ranked=True, is_completed=True,
+                        date_start=date(2024, 4, 1), date_end=date(2024, 4, 28), league_id=1)
+        db.session.add(season)
+        db.session.flush()
+        division = Division(name='SemiPro', priority=50, season_id=season.id)
+        db.session.add(division)
+        db.session.flush()
+        player5 = Player.query.filter_by(first_name='Player5').first()
+        db.session.add(Result(player_id=player5.id, position=1, match_count=5, win_count=5,
+                              division_id=division.id, relegation='unchanged'))
+        db.session.commit()
+        update_rankings()
+
+        latest = {r.player_id: r for r in Ranking.query.filter_by(partition='all', actual_date=date(2024, 4, 28))}
+        player1 = Player.query.filter_by(first_name='Player1').first()
+        assert (latest[player5.id].position, latest[player5.id].career_high) == (1, 1)
+        assert (latest[player1.id].position, latest[player1.id].career_high) == (2, 1)
+        assert player1.calculate_total_stats()['career_high'] == 1
+
+        single = calculate_rankings(date(2024, 5, 1))
+        assert {r.player_id: r.career_high for r in single}[player1.id] == 1
+
+
+def test_partitioned_rankings(app):
+    """Gender partitions rank their players on their own."""
+    with app.app_context():
+        from app import rebuild_rankings
+        from ranking import get_rankings_data, get_rankings_at
+
+        rebuild_rankings(jobs=2)
+
+        female = get_rankings_data(date(2024, 3, 28), partition='gender:female')
+        assert [r['first_name'] for r in female] == ['Player1', 'Player3', 'Player5']
+        assert [r['position'] for r in female] == [1, 2, 3]
+        at_date = get_rankings_at(date(2024, 3, 1), partition='gender:male')
+        stored = get_rankings_data(date(2024, 2, 28), partition='gender:male')
+        assert [(r['player_id'], r['position'], r['career_high']) for r in at_date] == \
+            [(r['player_id'], r['position'], r['career_high']) for r in stored]
+
+        single = calculate_rankings(date(2024, 4, 1), partition='gender:male')
+        assert [r.player_ref.first_name for r in single] == ['Player2', 'Player4']
+
+
+def test_compare_rule_sets(app):
+    """Rule sets are evaluated side by side on one extract of results."""
+    with app.app_context():
+        import pytest
+        from ranking import RankingRules, DEFAULT_RULES, compare_rule_sets, get_ranking_rules
+
+        rows = load_result_rows(filter_seasons='all')
+        no_expiry = RankingRules('no-expiry', expire_days=None)
+        short_expiry = RankingRules('short-expiry', expire_days=20)
+
+        differences = compare_rule_sets(rows, [date(2024, 2, 28), date(2024, 3, 20)],
+                                        [DEFAULT_RULES, no_expiry, short_expiry])
+        assert differences['no-expiry'] == []
+        # 2024-02-28 results expire after 20 days: nobody is ranked on 2024-03-20
+        assert len(differences['short-expiry']) == 5
+        assert all(d[0] == date(2024, 3, 20) and d[3] is None for d in differences['short-expiry'])
+
+        assert get_ranking_rules() is DEFAULT_RULES
+        with pytest.raises(ValueError):
+            RankingRules('broken', sort_order=('rating',))
+
+
+def test_current_rankings(app, count_queries):
+    """Current rank lookups are dict accesses, refreshed after rankings are rebuilt."""
+    with app.app_context():
+        import os
+        from app import rebuild_rankings
+        from extensions import db
+        from ranking_snapshot import get_current_rankings, get_ranking_snapshot_file, load_current_rankings
+
+        assert get_current_rankings() == {}
+        rebuild_rankings()
+        current = get_current_rankings()
+        players = Player.query.all()
+        for player in players:
+            ranking = player.get_current_ranking()
+            assert current[player.id] == (ranking.position, ranking.get_new_division())
+
+        with count_queries() as queries:
+            assert [p.get_current_position() for p in players] == [current[p.id][0] for p in players]
+        assert queries == []
+
+        # without the shared snapshot file the current rankings are read from the database
+        os.remove(get_ranking_snapshot_file())
+        assert get_current_rankings() == load_current_rankings() == current
+        Ranking.query.delete()
+        db.session.commit()
+        assert get_current_rankings() == {}
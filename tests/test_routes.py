@@ -121,4 +121,215 @@ def test_application_with_division_filter(client, app):
     """Test application route with division filter."""
     with app.app_context():
         response = client.get('/application?division_name=M1')
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 200
+
+def test_rankings_at_date(client, app):
+    """Test rankings route and API for an arbitrary date."""
+    with app.app_context():
+        response = client.get('/rankings?date=2024-02-15')
+        assert response.status_code == 200
+        assert b'2024-02-15' in response.data
+
+        response = client.get('/api/rankings?date=2024-02-15')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['date'] == '2024-02-15'
+        assert [r['position'] for r in data['rankings']] == [1, 2, 3, 4, 5]
+        assert data['rankings'][0]['last_result_date'] == '2024-01-28'
+
+
+def test_player_matches_route(client, app):
+    """Test player matches route."""
+    with app.app_context():
+        from models import Player
+        player = Player.query.first()
+
+        response = client.get(f'/player/{player.id}/matches')
+        assert response.status_code == 200
+
+
+def test_rankings_partition_filter(client, app):
+    """Test rankings route and API filtered by partition."""
+    with app.app_context():
+        from app import rebuild_rankings
+        rebuild_rankings()
+
+        response = client.get('/rankings?partition=gender:female')
+        assert response.status_code == 200
+        assert bytes('Женщины', 'utf-8') in response.data
+
+        data = client.get('/api/rankings?date=2024-02-15&partition=gender:male').get_json()
+        assert [r['first_name'] for r in data['rankings']] == ['Player2', 'Player4']
+
+        response = client.get('/api/rankings?partition=unknown')
+        assert response.status_code == 404
+
+
+def test_jobs_api(client, app):
+    """Test background jobs are started with a token and report their progress."""
+    from jobs import job_runner
+
+    assert client.post('/api/jobs', json={'type': 'update-rankings'}).status_code == 403
+
+    app.config['JOBS_TOKEN'] = 'secret'
+    try:
+        headers = {'X-Jobs-Token': 'secret'}
+        assert client.post('/api/jobs', json={'type': 'drop-tables'}, headers=headers).status_code == 400
+
+        response = client.post('/api/jobs', json={'type': 'import-matches', 'upsert': True}, headers=headers)
+        assert response.status_code == 202
+        job_id = response.get_json()['id']
+        assert job_runner.wait(timeout=30)
+
+        # job reports include tracebacks and CSV rows, they are not public either
+        assert client.get(f'/api/jobs/{job_id}').status_code == 403
+        assert client.get('/api/jobs', headers={'X-Jobs-Token': 'wrong'}).status_code == 403
+
+        job = client.get(f'/api/jobs/{job_id}', headers=headers).get_json()
+        assert job['status'] == 'done'
+        assert job['params'] == {'upsert': True}
+        # players of the test data do not play in the matches file
+        assert job['result']['skipped'] == job['progress']['rows'] > 0
+        assert job['events'][-1]['event'] == 'completed'
+        assert job['row_events'][-1]['reason'].startswith('Unknown')
+
+        assert job_id in [j['id'] for j in client.get('/api/jobs', headers=headers).get_json()['jobs']]
+        assert client.get('/api/jobs/unknown', headers=headers).status_code == 404
+
+        response = client.post('/api/jobs', json={'type': 'update-rankings', 'season_ids': [1]}, headers=headers)
+        assert response.status_code == 202
+        assert job_runner.wait(timeout=30)
+        job = client.get(f"/api/jobs/{response.get_json()['id']}", headers=headers).get_json()
+        assert (job['status'], job['params']) == ('done', {'season_ids': [1]})
+        assert client.post('/api/jobs', json={'type': 'update-rankings', 'season_ids': '1'},
+                           headers=headers).status_code == 400
+    finally:
+        app.config['JOBS_TOKEN'] = ''
+
+
+def test_cached_pages(client, app, count_queries, app_factory):
+    """Pages are rendered once per data version and revalidated by ETag without database queries."""
+    from cache import get_response_cache
+    from extensions import db
+    from models import Player
+
+    with app.app_context():
+        first = client.get('/rankings?season_id=2')
+        assert first.status_code == 200 and first.headers['ETag']
+        assert len(get_response_cache()) == 1
+
+        with count_queries() as queries:
+            cached = client.get('/rankings?season_id=2')
+            not_modified = client.get('/rankings?season_id=2', headers={'If-None-Match': first.headers['ETag']})
+        assert cached.data == first.data
+        assert not_modified.status_code == 304 and not_modified.data == b''
+        assert queries == []
+
+        assert b'Renamed' not in client.get('/player/1').data
+        # a write made outside the import functions still changes the data version of a database file
+        player = db.session.get(Player, 1)
+        player.first_name = 'Renamed'
+        db.session.commit()
+        changed = client.get('/player/1')
+        assert changed.status_code == 200
+        assert b'Renamed' in changed.data
+
+    # every app has a cache of its own, sized by its settings
+    assert app_factory(RESPONSE_CACHE_SIZE=1).extensions['response_cache'].max_entries == 1
+    assert app_factory(RESPONSE_CACHE=False).extensions['response_cache'] is None
+
+
+def test_ranking_snapshot_pages(client, app, count_queries):
+    """Current rankings, player search and profile header are served from the shared snapshot."""
+    from app import rebuild_rankings
+    from ranking_snapshot import get_ranking_snapshot, get_ranking_snapshot_file
+
+    urls = ['/rankings', '/rankings?partition=gender:female', '/api/search-players?q=player',
+            '/api/search-players?q=test2 player2', '/player/1']
+    with app.app_context():
+        app.config['RESPONSE_CACHE'] = False
+        try:
+            rebuild_rankings()
+            snapshot = get_ranking_snapshot()
+            assert snapshot.player(1)['position'] == 1 and snapshot.player(1)['new_division']
+            assert snapshot.player(99) is None
+
+            with count_queries() as queries:
+                from_snapshot = {url: client.get(url).data for url in urls[:-1]}
+            assert queries == []
+            from_snapshot[urls[-1]] = client.get(urls[-1]).data
+
+            os.remove(get_ranking_snapshot_file())
+            assert get_ranking_snapshot() is None
+            assert {url: client.get(url).data for url in urls} == from_snapshot
+        finally:
+            app.config['RESPONSE_CACHE'] = True
+
+
+def test_search_players_cache_and_rate_limit(client, app):
+    """Autocomplete results are cached, and clients over the limit only get cached results."""
+    import app as app_module
+    from ratelimit import TokenBucketLimiter
+
+    now = [0.]
+    limiter = TokenBucketLimiter(rate=1, burst=2, clock=lambda: now[0])
+    original, app_module.search_limiter = app_module.search_limiter, limiter
+    try:
+        with app.app_context():
+            response = client.get('/api/search-players?q=player1')
+            assert response.status_code == 200
+            assert [p['first_name'] for p in response.get_json()] == ['Player1']
+            assert 'max-age' in response.headers['Cache-Control']
+
+            assert client.get('/api/search-players?q=PLAYER1 ').status_code == 200
+            # bucket is empty: a cached query is still answered, a new one is refused
+            assert client.get('/api/search-players?q=Player1').get_json()[0]['first_name'] == 'Player1'
+            refused = client.get('/api/search-players?q=player2')
+            assert refused.status_code == 429 and refused.headers['Retry-After'] == '1'
+
+            now[0] += 1
+            assert client.get('/api/search-players?q=player2').status_code == 200
+    finally:
+        app_module.search_limiter = original
+
+
+def test_search_rate_limit_behind_proxy(client, app, monkeypatch, app_factory):
+    """Behind trusted proxies every forwarded client gets its own bucket."""
+    from flask import request
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    import app as app_module
+    from ratelimit import TokenBucketLimiter
+
+    environ = {'REMOTE_ADDR': '10.0.0.1'}
+    headers = {'X-Forwarded-For': '203.0.113.7'}
+    for proxies, address in ((0, '10.0.0.1'), (1, '203.0.113.7')):
+        # without trusted proxies the header is ignored, any client could send it
+        test_app = app_factory(TRUSTED_PROXIES=proxies)
+        test_app.add_url_rule('/client', 'client', lambda: request.remote_addr)
+        assert test_app.test_client().get('/client', headers=headers, environ_base=environ).text == address
+
+    monkeypatch.setattr(app_module, 'search_limiter', TokenBucketLimiter(rate=1, burst=1, clock=lambda: 0.))
+    monkeypatch.setattr(app, 'wsgi_app', ProxyFix(app.wsgi_app, x_for=1, x_proto=1))
+    with app.app_context():
+        def search(query, client_address):
+            return client.get(f'/api/search-players?q={query}', environ_base=environ,
+                              headers={'X-Forwarded-For': client_address}).status_code
+
+        assert search('player1', '203.0.113.7') == 200
+        assert search('player2', '203.0.113.7') == 429
+        assert search('player2', '198.51.100.2') == 200
+
+
+def test_token_bucket_limiter():
+    from ratelimit import TokenBucketLimiter
+
+    now = [0.]
+    limiter = TokenBucketLimiter(rate=2, burst=3, max_clients=2, clock=lambda: now[0])
+    assert [limiter.allow('a')[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow('a') == (False, 0.5)
+    now[0] += 0.5
+    assert limiter.allow('a') == (True, 0.)
+    assert limiter.allow('b')[0] and limiter.allow('c')[0]
+    # 'a' was dropped as the least recently seen client and starts with a full bucket
+    assert [limiter.allow('a')[0] for _ in range(4)] == [True, True, True, False]
+    assert TokenBucketLimiter(rate=0, burst=0).allow('a') == (True, 0.)